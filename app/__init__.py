@@ -7,17 +7,30 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_bootstrap import Bootstrap5
 from flask_wtf.csrf import CSRFProtect
+from .cache import ScheduleCache, UserCache
+from .events import ScheduleEvents
+from .activity import ActivityLogWriter
+from .export_jobs import ExportJobRunner
+from .metrics import RequestMetrics
+from .db_routing import DatabaseRouter, RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+db_router = DatabaseRouter()
 bcrypt = Bcrypt()
 login_manager = LoginManager()
 migrate = Migrate() # <--- 2. 创建 Migrate 实例
+schedule_cache = ScheduleCache()
+user_cache = UserCache()
+schedule_events = ScheduleEvents()
+activity_log_writer = ActivityLogWriter()
+export_jobs = ExportJobRunner()
+request_metrics = RequestMetrics()
 
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
 login_manager.login_message = '请先登录以访问此页面。'
 
-def create_app():
+def create_app(test_config=None):
     APP_DIR = os.path.dirname(os.path.abspath(__file__))
     TEMPLATE_DIR = os.path.join(APP_DIR, 'templates')
     STATIC_DIR = os.path.join(APP_DIR, 'static')
@@ -28,14 +41,31 @@ def create_app():
                 static_folder=STATIC_DIR)
 
     app.config.from_pyfile('config.py', silent=True)
+    # 基准测试等场景传入的配置覆盖 instance/config.py
+    if test_config:
+        app.config.update(test_config)
     
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
     
     bootstrap = Bootstrap5(app)
+    # 需要先把只读副本注册为 bind，再由 Flask-SQLAlchemy 创建引擎
+    db_router.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db) # <--- 3. 初始化 Migrate
+    from .log_archive import include_object as include_archive_object
+    from .search import include_object as include_search_object
+
+    def include_object(*args):
+        return include_archive_object(*args) and include_search_object(*args)
+
+    migrate.init_app(app, db, include_object=include_object) # <--- 3. 初始化 Migrate
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    schedule_cache.init_app(app)
+    user_cache.init_app(app)
+    schedule_events.init_app(app)
+    activity_log_writer.init_app(app)
+    export_jobs.init_app(app)
+    request_metrics.init_app(app)
     CSRFProtect(app)
     
     with app.app_context():
@@ -47,6 +77,16 @@ def create_app():
         app.register_blueprint(main_routes.main_bp)
         app.register_blueprint(admin_routes.admin_bp)
 
+        from .commands import (logs_cli, exports_cli, personnel_cli, search_cli, trash_cli, content_cli,
+                               check_query_plans_command)
+        app.cli.add_command(logs_cli)
+        app.cli.add_command(search_cli)
+        app.cli.add_command(trash_cli)
+        app.cli.add_command(exports_cli)
+        app.cli.add_command(personnel_cli)
+        app.cli.add_command(content_cli)
+        app.cli.add_command(check_query_plans_command)
+
         # 我们不再需要 db.create_all() 和自动设置管理员的逻辑
         # from .models import User
         # if User.query.count() == 1: ...
@@ -0,0 +1,105 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+
+
+class ActivityLogWriter:
+    """
+    操作日志的缓冲写入器。
+
+    buffered 模式下日志先进入进程内队列，由后台线程在条数或时间达到阈值时批量 INSERT，
+    进程退出时会把剩余日志全部写入；队列已满时在调用方线程中同步写入。
+    sync 模式下每条日志立即单独提交。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = 'sync'
+        self.batch_size = 100
+        self.flush_interval = 2.0
+        self.max_queue = 10000
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config.get('ACTIVITY_LOG_MODE', 'buffered')
+        self.batch_size = app.config.get('ACTIVITY_LOG_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('ACTIVITY_LOG_FLUSH_INTERVAL', 2.0)
+        self.max_queue = app.config.get('ACTIVITY_LOG_MAX_QUEUE', 10000)
+        if self.mode not in ('buffered', 'sync'):
+            raise ValueError(f'未知的 ACTIVITY_LOG_MODE: {self.mode}')
+        app.extensions['activity_log_writer'] = self
+        atexit.register(self.flush)
+
+    def write(self, user_id, action, details):
+        entry = {
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'timestamp': datetime.utcnow(),
+        }
+        if self.mode == 'sync':
+            self._insert([entry])
+            return
+
+        with self._lock:
+            overflow = len(self._buffer) >= self.max_queue
+            if not overflow:
+                self._buffer.append(entry)
+                pending = len(self._buffer)
+        if overflow:
+            # 后台线程跟不上时退化为同步写入，保证日志不丢失
+            self.flush()
+            self._insert([entry])
+            return
+
+        self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """把当前进程缓冲区中的日志全部写入数据库。"""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if entries:
+                self._insert(entries)
+
+    def _insert(self, entries):
+        from sqlalchemy import insert
+        from . import db
+        from .models import ActivityLog
+
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(ActivityLog), entries)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('写入 %d 条操作日志失败', len(entries))
+            finally:
+                db.session.remove()
+
+    def _ensure_thread(self):
+        # gunicorn fork 之后线程不会被继承，按进程号判断是否需要重新启动
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
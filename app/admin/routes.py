@@ -1,10 +1,12 @@
+import hmac
 import secrets
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, abort, current_app
 from flask_login import login_required, current_user
 from . import admin_bp
 from .forms import PersonnelForm
-from app import db
-from app.models import Personnel, User
+from app import db, schedule_cache, user_cache, request_metrics
+from app.models import Personnel, User, TaskAssignment
+from app.schedule import link_personnel_assignments
 from app.utils import log_activity
 from app.decorators import admin_required
 
@@ -16,7 +18,10 @@ def manage_personnel():
     if form.validate_on_submit():
         person = Personnel(name=form.name.data)
         db.session.add(person)
+        db.session.flush()
+        link_personnel_assignments(person)
         db.session.commit()
+        schedule_cache.invalidate_personnel()
         log_activity('添加人员', f"添加了新人员: {person.name}")
         flash(f'人员 "{person.name}" 已成功添加。', 'success')
         return redirect(url_for('admin.manage_personnel'))
@@ -30,11 +35,34 @@ def manage_personnel():
 def delete_personnel(person_id):
     person = Personnel.query.get_or_404(person_id)
     log_activity('删除人员', f"删除了人员: {person.name}")
+    # 与外键的 ON DELETE SET NULL 一致；SQLite 默认不执行外键动作，这里显式置空
+    TaskAssignment.query.filter_by(personnel_id=person.id) \
+        .update({TaskAssignment.personnel_id: None}, synchronize_session=False)
     db.session.delete(person)
     db.session.commit()
+    schedule_cache.invalidate_personnel()
     flash(f'人员 "{person.name}" 已被删除。', 'success')
     return redirect(url_for('admin.manage_personnel'))
 
+@admin_bp.route('/api/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(schedule_cache.stats())
+
+@admin_bp.route('/metrics')
+def metrics():
+    """
+    Prometheus 格式的请求统计，仅管理员可见。配置了 METRICS_TOKEN 时，
+    采集程序也可以用 Authorization: Bearer <token> 访问。
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not token_ok and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(request_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @admin_bp.route('/users')
 @login_required
 @admin_required
@@ -60,6 +88,7 @@ def update_user_permissions(user_id):
     if permission_name in ['is_admin', 'can_add', 'can_edit', 'can_delete']:
         setattr(user, permission_name, value)
         db.session.commit()
+        user_cache.invalidate(user.id)
         log_activity('更新用户权限', f"更新了用户 {user.username} 的权限 '{permission_name}' 为 {value}")
         return jsonify({'success': True})
     
@@ -78,6 +107,7 @@ def delete_user(user_id):
     username = user_to_delete.username
     db.session.delete(user_to_delete)
     db.session.commit()
+    user_cache.invalidate(user_id)
     log_activity('删除用户', f"管理员 {current_user.username} 删除了用户 {username}")
     flash(f'用户 "{username}" 已被成功删除。', 'success')
     return redirect(url_for('admin.manage_users'))
@@ -91,6 +121,7 @@ def reset_password(user_id):
     new_password = secrets.token_urlsafe(8) # 生成一个8位的随机密码
     user_to_reset.set_password(new_password)
     db.session.commit()
+    user_cache.invalidate(user_id)
     
     log_activity('重置密码', f"管理员 {current_user.username} 重置了用户 {user_to_reset.username} 的密码")
     flash(f'用户 "{user_to_reset.username}" 的密码已被重置。新密码是: {new_password}', 'warning')
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, cast, func, select
+from . import db
+from .models import WorkSchedule, TaskAssignment, Personnel
+
+BUCKET_DAY = 'day'
+BUCKET_WEEK = 'week'
+
+
+def workload_rows(start_date, end_date, personnel_names=None):
+    """
+    数据库中按 (人员, 日期) 分组统计任务数，返回 [(姓名, 'YYYY-MM-DD', 任务数)]。
+    日期以字符串取回，交给 pandas 整列解析，避免逐行构造 date 对象。
+    """
+    task_date = cast(WorkSchedule.task_date, String)
+    query = select(TaskAssignment.personnel_name, task_date, func.count()) \
+        .join(WorkSchedule, TaskAssignment.task_id == WorkSchedule.id) \
+        .where(WorkSchedule.is_deleted == False,
+               WorkSchedule.task_date.between(start_date, end_date)) \
+        .group_by(TaskAssignment.personnel_name, task_date)
+    if personnel_names:
+        query = query.where(TaskAssignment.personnel_name.in_(personnel_names))
+    return db.session.connection().execute(query).all()
+
+
+def workload_matrix(start_date, end_date, personnel_names=None):
+    """
+    返回 人员 x 日期 的任务数矩阵 (DataFrame)，范围内每一天都有一列。
+    未指定人员时包含人员表中的所有人，没有任务的人员整行为 0。
+    """
+    rows = workload_rows(start_date, end_date, personnel_names)
+    names, task_dates, counts = zip(*rows) if rows else ((), (), ())
+
+    known_names = personnel_names or db.session.scalars(select(Personnel.name)).all()
+    index = pd.Index(sorted(set(known_names) | set(names)))
+    days = pd.date_range(start_date, end_date, freq='D')
+
+    # 直接按 (人员序号, 日期偏移) 散列累加到矩阵中，比 pivot_table 快一个数量级
+    row_codes = index.get_indexer(pd.Index(names, dtype=object))
+    day_offsets = (pd.to_datetime(pd.Index(task_dates, dtype=object), format='%Y-%m-%d') - days[0]).days
+    values = np.zeros((len(index), len(days)), dtype=np.int64)
+    np.add.at(values, (row_codes, np.asarray(day_offsets)), np.asarray(counts, dtype=np.int64))
+    return pd.DataFrame(values, index=index, columns=days)
+
+
+def build_workload_report(start_date, end_date, bucket=BUCKET_DAY, overload_threshold=2, personnel_names=None):
+    """
+    工作量统计：每人的任务数、有任务的天数、利用率（有任务的工作日 / 工作日总数）、
+    单日峰值和超载天数（单日任务数超过 overload_threshold），以及按日或按周汇总的热力图。
+    """
+    matrix = workload_matrix(start_date, end_date, personnel_names)
+    values = matrix.to_numpy()
+    days = matrix.columns
+
+    is_workday = days.dayofweek < 5
+    workday_count = int(is_workday.sum())
+    busy = values > 0
+    overloaded = values > overload_threshold
+
+    totals = values.sum(axis=1)
+    busy_days = busy.sum(axis=1)
+    busy_workdays = busy[:, is_workday].sum(axis=1)
+    peaks = values.max(axis=1) if values.shape[1] else np.zeros(len(matrix), dtype=np.int64)
+    overloaded_days = overloaded.sum(axis=1)
+    utilization = busy_workdays / workday_count if workday_count else np.zeros(len(matrix))
+
+    personnel = [
+        {
+            'name': name,
+            'total_tasks': int(total),
+            'busy_days': int(busy_count),
+            'utilization': round(float(ratio), 4),
+            'peak_daily_tasks': int(peak),
+            'overloaded_days': int(overload_count),
+        }
+        for name, total, busy_count, ratio, peak, overload_count
+        in zip(matrix.index, totals, busy_days, utilization, peaks, overloaded_days)
+    ]
+
+    day_labels = list(days.strftime('%Y-%m-%d'))
+    row_idx, col_idx = np.nonzero(overloaded)
+    overload_events = [
+        {'name': name, 'date': day_labels[c], 'tasks': tasks}
+        for name, c, tasks in zip(matrix.index[row_idx], col_idx, values[row_idx, col_idx].tolist())
+    ]
+
+    if bucket == BUCKET_WEEK:
+        # 按周一对齐分桶，首尾不完整的周也各占一列
+        week_starts = days - pd.to_timedelta(days.dayofweek, unit='D')
+        heatmap = matrix.T.groupby(week_starts).sum().T
+    else:
+        heatmap = matrix
+
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'bucket': bucket,
+        'overload_threshold': overload_threshold,
+        'workdays': workday_count,
+        'personnel': personnel,
+        'overloads': overload_events,
+        'heatmap': {
+            'names': list(heatmap.index),
+            'buckets': list(heatmap.columns.strftime('%Y-%m-%d')),
+            'values': heatmap.to_numpy().tolist(),
+            'max': int(heatmap.to_numpy().max()) if heatmap.size else 0,
+        },
+    }
@@ -3,7 +3,7 @@ from flask import render_template, url_for, flash, redirect, request
 from . import auth_bp
 from .forms import RegistrationForm, LoginForm, InvitationForm, ChangePasswordForm
 from app.models import User, InvitationCode
-from app import db, bcrypt
+from app import db, bcrypt, user_cache
 from flask_login import login_user, current_user, logout_user, login_required
 from app.utils import log_activity
 from app.decorators import admin_required
@@ -77,9 +77,12 @@ def invite():
 def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if bcrypt.check_password_hash(current_user.password_hash, form.current_password.data):
-            current_user.set_password(form.new_password.data)
+        # current_user 是缓存中的只读快照，修改密码需要取得数据库中的用户
+        user = db.session.get(User, current_user.id)
+        if bcrypt.check_password_hash(user.password_hash, form.current_password.data):
+            user.set_password(form.new_password.data)
             db.session.commit()
+            user_cache.invalidate(user.id)
             log_activity('修改密码', '用户自行修改密码成功')
             flash('您的密码已成功更新。', 'success')
             return redirect(url_for('main.index'))
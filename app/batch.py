@@ -0,0 +1,205 @@
+from datetime import datetime
+from sqlalchemy import delete, insert, update
+from . import db
+from .models import WorkSchedule, TaskAssignment
+from .content import intern_contents
+from .schedule import max_positions_query, resolve_personnel_ids, POSITION_GAP
+from .search import build_search_text
+from .trash import restore_tasks
+
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+OP_RESTORE = 'restore'
+OP_MOVE = 'move'
+
+# 各操作需要的权限，与单任务接口保持一致
+OP_PERMISSIONS = {
+    OP_UPDATE: 'can_edit',
+    OP_MOVE: 'can_edit',
+    OP_DELETE: 'can_delete',
+    OP_RESTORE: 'can_add',
+}
+# 需要携带 version 做乐观锁检查的操作
+VERSIONED_OPS = {OP_UPDATE, OP_MOVE, OP_DELETE}
+
+
+class BatchError(Exception):
+    def __init__(self, status, error):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise BatchError('invalid', '无效的日期格式')
+
+
+def _validate(operation, task, user, sanitize):
+    """检查单个操作，返回规整后的操作；不合法时抛出 BatchError。"""
+    op = operation.get('op')
+    if op not in OP_PERMISSIONS:
+        raise BatchError('invalid', f'未知的操作: {op}')
+    permission = OP_PERMISSIONS[op]
+    if not user.is_admin and not getattr(user, permission, False):
+        raise BatchError('forbidden', '权限不足，无法执行此操作。')
+    if task is None:
+        raise BatchError('not_found', '任务不存在。')
+
+    if op in VERSIONED_OPS:
+        if operation.get('version') is None:
+            raise BatchError('invalid', '缺少 version。')
+        if task.version != operation['version']:
+            raise BatchError('conflict', '此任务已被他人修改。')
+
+    if op == OP_RESTORE:
+        if not task.is_deleted:
+            raise BatchError('invalid', '任务未被删除。')
+        return {'op': op}
+    if task.is_deleted:
+        raise BatchError('not_found', '任务已被删除。')
+    if op == OP_DELETE:
+        return {'op': op}
+
+    if op == OP_MOVE:
+        position = operation.get('position')
+        if position is not None and (not isinstance(position, int) or position < 0):
+            raise BatchError('invalid', '无效的 position')
+        return {'op': op, 'task_date': _parse_date(operation.get('task_date')), 'position': position}
+
+    changes = {'op': op}
+    if 'content' in operation:
+        content = sanitize(operation.get('content'))
+        if not content:
+            raise BatchError('invalid', '工作内容不能为空。')
+        changes['content'] = content
+    if 'personnel' in operation:
+        personnel = operation.get('personnel')
+        if not isinstance(personnel, list):
+            raise BatchError('invalid', 'personnel 必须是列表。')
+        names = [item['value'] if isinstance(item, dict) else item for item in personnel]
+        names = [name.strip() for name in names if isinstance(name, str) and name.strip()]
+        if not names:
+            raise BatchError('invalid', '至少需要一名人员。')
+        changes['personnel'] = list(dict.fromkeys(names))
+    if operation.get('task_date'):
+        changes['task_date'] = _parse_date(operation['task_date'])
+    if len(changes) == 1:
+        raise BatchError('invalid', '没有需要更新的字段。')
+    return changes
+
+
+def apply_batch(operations, user, sanitize, atomic=True):
+    """
+    执行一组任务操作。先一次性加载并锁定所有任务、逐项校验，再按操作类型分别用批量 SQL 写入，
+    不负责提交事务。atomic 为真时任何一项失败都不写入。
+
+    返回 (逐项结果, 是否已写入, 变更摘要)。变更摘要为 {操作: [(任务 id, 受影响的日期...)]}。
+    """
+    task_ids = {op.get('id') for op in operations if isinstance(op.get('id'), int)}
+    # 行锁保持到提交：并发的批量操作或单任务修改要等本批次结束，version 检查之后不会再被人改掉。
+    # 按 id 顺序加锁，避免两个批次互相等待。SQLite 会忽略 FOR UPDATE，只适合开发环境
+    tasks = {task.id: task for task in WorkSchedule.query.filter(WorkSchedule.id.in_(task_ids))
+             .order_by(WorkSchedule.id).with_for_update(of=WorkSchedule).populate_existing()} \
+        if task_ids else {}
+
+    results, valid, seen = [], [], set()
+    for index, operation in enumerate(operations):
+        task_id = operation.get('id')
+        result = {'index': index, 'id': task_id, 'op': operation.get('op')}
+        try:
+            if not isinstance(task_id, int):
+                raise BatchError('invalid', '缺少任务 ID。')
+            if task_id in seen:
+                raise BatchError('invalid', '同一批次中每个任务只能出现一次。')
+            seen.add(task_id)
+            task = tasks.get(task_id)
+            valid.append((result, task, _validate(operation, task, user, sanitize)))
+            result['status'] = 'ok'
+        except BatchError as e:
+            result.update(status=e.status, error=e.error)
+            if e.status == 'conflict':
+                result['current'] = {
+                    'content': task.content,
+                    'personnel': [a.personnel_name for a in task.assignments],
+                    'version': task.version,
+                }
+        results.append(result)
+
+    if not valid or (atomic and len(valid) < len(operations)):
+        if atomic:
+            for result in results:
+                if result['status'] == 'ok':
+                    result['status'] = 'skipped'
+        return results, False, {}
+
+    now = datetime.utcnow()
+    changed = {}
+    row_updates, personnel_changes, delete_ids, restore_ids = [], {}, [], []
+
+    move_dates = [changes['task_date'] for _, _, changes in valid
+                  if changes['op'] == OP_MOVE and changes['position'] is None]
+    content_ids = intern_contents([changes['content'] for _, _, changes in valid if 'content' in changes])
+    next_positions = {day: pos + POSITION_GAP for day, pos in max_positions_query(move_dates).all()} \
+        if move_dates else {}
+
+    for result, task, changes in valid:
+        op = changes['op']
+        if op == OP_DELETE:
+            delete_ids.append(task.id)
+            changed.setdefault('deleted', []).append((task.id, task.task_date))
+            continue
+        if op == OP_RESTORE:
+            restore_ids.append(task.id)
+            continue
+
+        row = {'id': task.id, 'version': task.version + 1, 'updated_at': now}
+        if op == OP_MOVE:
+            new_date = changes['task_date']
+            position = changes['position']
+            if position is None:
+                position = next_positions.get(new_date, 0)
+                next_positions[new_date] = position + POSITION_GAP
+            row.update(task_date=new_date, position=position)
+            changed.setdefault('moved', []).append((task.id, task.task_date, new_date))
+        else:
+            content = changes.get('content', task.content)
+            personnel = changes.get('personnel', [a.personnel_name for a in task.assignments])
+            row['search_text'] = build_search_text(content, personnel)
+            if 'content' in changes:
+                row['content_id'] = content_ids[content]
+            if 'task_date' in changes:
+                row['task_date'] = changes['task_date']
+            if 'personnel' in changes:
+                personnel_changes[task.id] = personnel
+            changed.setdefault('updated', []).append((task.id, task.task_date, changes.get('task_date')))
+        result['version'] = row['version']
+        row_updates.append(row)
+
+    if row_updates:
+        db.session.execute(update(WorkSchedule).execution_options(synchronize_session=False), row_updates)
+    if personnel_changes:
+        personnel_ids = resolve_personnel_ids({name for names in personnel_changes.values() for name in names})
+        db.session.execute(
+            delete(TaskAssignment).where(TaskAssignment.task_id.in_(list(personnel_changes)))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(insert(TaskAssignment), [
+            {'task_id': task_id, 'personnel_id': personnel_ids.get(name), 'personnel_name': name, 'position': index}
+            for task_id, names in personnel_changes.items()
+            for index, name in enumerate(names)
+        ])
+    if delete_ids:
+        db.session.execute(
+            update(WorkSchedule).where(WorkSchedule.id.in_(delete_ids))
+            .values(is_deleted=True, deleted_at=now, deleted_by_id=user.id)
+            .execution_options(synchronize_session=False)
+        )
+    if restore_ids:
+        changed['restored'] = restore_tasks(restore_ids)
+
+    # 批量 SQL 绕过了会话中已加载的对象，避免之后读到旧数据
+    db.session.expire_all()
+    return results, True, changed
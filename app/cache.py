@@ -0,0 +1,270 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class MemoryCacheBackend:
+    """进程内 LRU 缓存，条目超过 ttl 秒后失效。"""
+
+    def __init__(self, max_entries=256, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileSystemCacheBackend:
+    """
+    以目录中的 JSON 文件作为共享缓存，同一主机上的多个 gunicorn worker 可以共用，
+    可作为 Redis 等外部缓存的本地替代。
+    """
+
+    def __init__(self, cache_dir, max_entries=256, ttl=60):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key.replace(':', '_') + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item['expires_at'] < time.time():
+            self.delete(key)
+            return None
+        return item['value']
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'expires_at': time.time() + self.ttl, 'value': value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def delete(self, *keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                self.delete(name[:-len('.json')])
+
+    def _prune(self):
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.json')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class NullCacheBackend:
+    """关闭缓存时使用，所有读取都未命中。"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class UserCache:
+    """
+    登录用户的进程内缓存：以用户 id 为键缓存用户名和权限，使 load_user 在常见情况下不访问数据库。
+    修改权限、删除用户、修改密码后调用 invalidate；其他 worker 中的条目最多滞后 USER_CACHE_TTL 秒。
+    """
+
+    FIELDS = ('id', 'username', 'is_admin', 'can_add', 'can_edit', 'can_delete')
+
+    def __init__(self, app=None):
+        self.backend = NullCacheBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('USER_CACHE_TTL', 30)
+        max_entries = app.config.get('USER_CACHE_MAX_ENTRIES', 1024)
+        self.backend = MemoryCacheBackend(max_entries, ttl) if ttl else NullCacheBackend()
+        app.extensions['user_cache'] = self
+
+    @staticmethod
+    def _key(user_id):
+        return f'user:{user_id}'
+
+    def get(self, user_id):
+        return self.backend.get(self._key(user_id))
+
+    def set(self, user):
+        data = {field: getattr(user, field) for field in self.FIELDS}
+        self.backend.set(self._key(user.id), data)
+        return data
+
+    def invalidate(self, *user_ids):
+        if user_ids:
+            self.backend.delete(*[self._key(user_id) for user_id in user_ids])
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+class ScheduleCache:
+    """
+    周计划视图缓存：以周一日期为键，缓存分组后的周计划数据和按权限渲染好的表格片段；
+    人员列表单独缓存。写操作通过 invalidate_dates / invalidate_personnel 精确失效。
+
+    每周有一个代号，失效时更换。条目记录生成时读到的代号，读取时代号不一致即视为未命中；
+    写回时代号已变化则直接丢弃，这样失效之前查出的旧数据不会在失效之后又被写回缓存。
+    """
+
+    KINDS = ('week', 'fragment', 'personnel')
+
+    def __init__(self, app=None):
+        self.backend = NullCacheBackend()
+        self._stats_lock = threading.Lock()
+        self._stats = {kind: {'hits': 0, 'misses': 0} for kind in self.KINDS}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('SCHEDULE_CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('SCHEDULE_CACHE_MAX_ENTRIES', 256)
+        ttl = app.config.get('SCHEDULE_CACHE_TTL', 60)
+        if backend == 'memory':
+            self.backend = MemoryCacheBackend(max_entries, ttl)
+        elif backend == 'filesystem':
+            cache_dir = app.config.get('SCHEDULE_CACHE_DIR') or os.path.join(app.instance_path, 'schedule_cache')
+            self.backend = FileSystemCacheBackend(cache_dir, max_entries, ttl)
+        elif backend in (None, 'null'):
+            self.backend = NullCacheBackend()
+        else:
+            raise ValueError(f'未知的 SCHEDULE_CACHE_BACKEND: {backend}')
+        app.extensions['schedule_cache'] = self
+
+    def _record(self, kind, hit):
+        with self._stats_lock:
+            self._stats[kind]['hits' if hit else 'misses'] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {kind: dict(counts) for kind, counts in self._stats.items()}
+
+    @staticmethod
+    def _week_key(start_of_week):
+        return f'week:{start_of_week.isoformat()}'
+
+    @staticmethod
+    def _generation_key(start_of_week):
+        return f'generation:{start_of_week.isoformat()}'
+
+    @staticmethod
+    def _fragment_key(start_of_week, variant):
+        return f'fragment:{start_of_week.isoformat()}:{variant}'
+
+    def _new_generation(self, start_of_week):
+        # 用随机值而不是自增计数：文件缓存由多个 worker 共用，读改写的计数可能重复
+        generation = uuid.uuid4().hex
+        self.backend.set(self._generation_key(start_of_week), generation)
+        return generation
+
+    def _generation(self, start_of_week):
+        generation = self.backend.get(self._generation_key(start_of_week))
+        return generation if generation is not None else self._new_generation(start_of_week)
+
+    def _get_current(self, key, generation):
+        item = self.backend.get(key)
+        if item is None or item['generation'] != generation:
+            return None
+        return item['value']
+
+    def _set_current(self, key, start_of_week, generation, value):
+        if self.backend.get(self._generation_key(start_of_week)) == generation:
+            self.backend.set(key, {'generation': generation, 'value': value})
+
+    def get_week(self, start_of_week):
+        """返回 (周计划数据或 None, 代号)。未命中时需把代号原样传给 set_week。"""
+        generation = self._generation(start_of_week)
+        payload = self._get_current(self._week_key(start_of_week), generation)
+        self._record('week', payload is not None)
+        return payload, generation
+
+    def set_week(self, start_of_week, payload, generation):
+        self._set_current(self._week_key(start_of_week), start_of_week, generation, payload)
+
+    def get_fragment(self, start_of_week, variant, generation):
+        fragment = self._get_current(self._fragment_key(start_of_week, variant), generation)
+        self._record('fragment', fragment is not None)
+        return fragment
+
+    def set_fragment(self, start_of_week, variant, generation, fragment):
+        self._set_current(self._fragment_key(start_of_week, variant), start_of_week, generation, fragment)
+
+    def get_personnel(self):
+        names = self.backend.get('personnel')
+        self._record('personnel', names is not None)
+        return names
+
+    def set_personnel(self, names):
+        self.backend.set('personnel', names)
+
+    def invalidate_dates(self, dates):
+        """使包含给定日期的所有周失效。各权限的表格片段随代号一起失效。"""
+        weeks = {week_start(day) for day in dates if day is not None}
+        for start_of_week in weeks:
+            self._new_generation(start_of_week)
+        if weeks:
+            self.backend.delete(*[self._week_key(start_of_week) for start_of_week in weeks])
+
+    def invalidate_personnel(self):
+        self.backend.delete('personnel')
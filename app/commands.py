@@ -0,0 +1,144 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+logs_cli = AppGroup('logs', help='操作日志维护命令。')
+exports_cli = AppGroup('exports', help='后台导出文件维护命令。')
+personnel_cli = AppGroup('personnel', help='人员数据维护命令。')
+search_cli = AppGroup('search', help='任务检索索引维护命令。')
+trash_cli = AppGroup('trash', help='回收站维护命令。')
+content_cli = AppGroup('content', help='任务内容存储维护命令。')
+
+
+@logs_cli.command('archive')
+@click.option('--older-than-days', type=int, default=None,
+              help='归档早于该天数的日志，默认使用 ACTIVITY_LOG_RETENTION_DAYS。')
+@click.option('--batch-size', type=int, default=None,
+              help='每批移动的行数，默认使用 ACTIVITY_LOG_ARCHIVE_BATCH_SIZE。')
+def archive_logs(older_than_days, batch_size):
+    """把过期日志移动到按月归档表，可由 cron 等定时任务调用。"""
+    from .log_archive import archive_activity_logs
+
+    if older_than_days is None:
+        older_than_days = current_app.config.get('ACTIVITY_LOG_RETENTION_DAYS', 180)
+    if batch_size is None:
+        batch_size = current_app.config.get('ACTIVITY_LOG_ARCHIVE_BATCH_SIZE', 5000)
+    moved = archive_activity_logs(older_than_days, batch_size)
+    click.echo(f'已归档 {moved} 条早于 {older_than_days} 天的操作日志。')
+
+
+@exports_cli.command('cleanup')
+@click.option('--older-than-days', type=int, default=None,
+              help='删除早于该天数的导出任务和文件，默认使用 EXPORT_RETENTION_DAYS。')
+def cleanup_exports(older_than_days):
+    """清理过期的后台导出任务及其生成的文件。"""
+    from . import export_jobs
+
+    if older_than_days is None:
+        older_than_days = current_app.config.get('EXPORT_RETENTION_DAYS', 7)
+    removed = export_jobs.cleanup(older_than_days)
+    click.echo(f'已删除 {removed} 个早于 {older_than_days} 天的导出任务。')
+
+
+@personnel_cli.command('backfill-ids')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='每批更新的分配记录数。')
+def backfill_personnel_ids(batch_size):
+    """按姓名为任务分配记录补齐 personnel_id，可重复执行。"""
+    from .schedule import backfill_personnel_ids as backfill
+
+    scanned, linked = backfill(batch_size)
+    click.echo(f'检查了 {scanned} 条未关联的分配记录，其中 {linked} 条已关联到人员。')
+
+
+@content_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='每批迁移的任务数。')
+def backfill_content(batch_size):
+    """把任务表中旧 content 列的内容迁移到去重的内容表，可重复执行。"""
+    from .content import backfill_content as backfill
+
+    migrated = backfill(batch_size)
+    click.echo(f'已将 {migrated} 个任务的内容迁移到内容表。')
+
+
+@content_cli.command('prune')
+def prune_content():
+    """删除不再被任何任务引用的内容（SQLite 上请在没有写入时执行）。"""
+    from .content import prune_contents
+
+    removed = prune_contents()
+    click.echo(f'已删除 {removed} 条未被引用的内容。')
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='输出每个查询的完整执行计划。')
+@click.option('--sample', is_flag=True,
+              help='不检查当前数据库，而是在临时 SQLite 数据库中建表、写入样例数据后检查。')
+@click.option('--sample-url', default=None,
+              help='写入样例数据的空数据库（如 CI 中的 PostgreSQL），检查结束后删除所有表；隐含 --sample。')
+@with_appcontext
+def check_query_plans_command(verbose, sample, sample_url):
+    """EXPLAIN 周视图等热点查询，任何一个退化为顺序扫描或临时索引时以非零状态退出，可用于 CI。"""
+    import os
+    import tempfile
+    from . import create_app, db
+    from .query_plans import report_query_plans, seed_sample_data
+
+    if not (sample or sample_url):
+        if not report_query_plans(click.echo, verbose):
+            raise SystemExit(1)
+        return
+
+    temp_path = None
+    if not sample_url:
+        fd, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        sample_url = 'sqlite:///' + temp_path
+    sample_app = create_app({
+        'SQLALCHEMY_DATABASE_URI': sample_url,
+        'SQLALCHEMY_REPLICA_URIS': [],
+        'SCHEDULE_EVENTS_BACKEND': 'null',
+    })
+    try:
+        with sample_app.app_context():
+            db.create_all()
+            try:
+                tasks = seed_sample_data()
+                click.echo(f'已写入 {tasks} 个样例任务。')
+                passed = report_query_plans(click.echo, verbose)
+            finally:
+                db.session.remove()
+                db.drop_all()
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    if not passed:
+        raise SystemExit(1)
+
+
+@search_cli.command('setup')
+@click.option('--rebuild', is_flag=True, help='重新计算所有任务的检索文本，而不只是缺失的。')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='每批更新的任务数。')
+def setup_search(rebuild, batch_size):
+    """创建检索索引（PostgreSQL 为 pg_trgm GIN 索引，SQLite 为 FTS5 表）并补齐检索文本。"""
+    from .search import setup_search_index, rebuild_search_text, search_backend
+
+    setup_search_index()
+    updated = rebuild_search_text(batch_size, only_missing=not rebuild)
+    click.echo(f'检索方式: {search_backend()}，已更新 {updated} 个任务的检索文本。')
+
+
+@trash_cli.command('purge')
+@click.option('--older-than-days', type=int, default=None,
+              help='彻底删除进入回收站超过该天数的任务，默认使用 TRASH_RETENTION_DAYS。')
+@click.option('--batch-size', type=int, default=None,
+              help='每批删除的任务数，默认使用 TRASH_PURGE_BATCH_SIZE。')
+def purge_trash(older_than_days, batch_size):
+    """分批清理回收站中的过期任务及其人员分配，可由 cron 等定时任务调用。"""
+    from .trash import purge_expired
+
+    if older_than_days is None:
+        older_than_days = current_app.config.get('TRASH_RETENTION_DAYS', 30)
+    if batch_size is None:
+        batch_size = current_app.config.get('TRASH_PURGE_BATCH_SIZE', 500)
+    purged = purge_expired(older_than_days, batch_size)
+    click.echo(f'已彻底删除 {purged} 个进入回收站超过 {older_than_days} 天的任务。')
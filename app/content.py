@@ -0,0 +1,99 @@
+import hashlib
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db
+from .models import WorkSchedule, TaskContent
+
+# 任务内容的 HTML：已迁移的任务取内容表，尚未迁移的历史任务取任务表中的旧列。
+# 使用时需要 outerjoin(TaskContent, WorkSchedule.content_id == TaskContent.id)
+content_html = func.coalesce(TaskContent.html, WorkSchedule.legacy_content)
+
+
+def content_digest(html):
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def _insert_ignoring_duplicates():
+    """并发写入同一内容时以先插入的为准，其余请求忽略唯一键冲突。"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(TaskContent).on_conflict_do_nothing(index_elements=['digest'])
+    if dialect == 'sqlite':
+        return sqlite.insert(TaskContent).on_conflict_do_nothing(index_elements=['digest'])
+    return insert(TaskContent)
+
+
+def intern_contents(htmls):
+    """
+    把一组清洗后的 HTML 写入内容表（已存在的直接复用），返回 {html: 内容 id}。
+    至多一次查询、一次批量插入和一次补查；不负责提交事务。
+    """
+    digests = {html: content_digest(html) for html in set(htmls)}
+    if not digests:
+        return {}
+
+    def lookup(wanted):
+        # FOR KEY SHARE 锁住取到的内容直到事务提交，prune_contents 会跳过这些行，
+        # 不会在任务写入引用之前把内容删掉
+        return dict(db.session.execute(
+            select(TaskContent.digest, TaskContent.id).where(TaskContent.digest.in_(wanted))
+            .with_for_update(read=True, key_share=True)
+        ).all())
+
+    ids = lookup(set(digests.values()))
+    missing = {html: digest for html, digest in digests.items() if digest not in ids}
+    if missing:
+        db.session.execute(_insert_ignoring_duplicates(),
+                           [{'digest': digest, 'html': html} for html, digest in missing.items()])
+        ids.update(lookup(set(missing.values())))
+    return {html: ids[digest] for html, digest in digests.items()}
+
+
+def intern_content(html):
+    """单条内容的 intern_contents，返回 TaskContent 对象。"""
+    return db.session.get(TaskContent, intern_contents([html])[html])
+
+
+def backfill_content(batch_size=1000):
+    """
+    把任务表旧 content 列中的内容按主键分批迁移到内容表，迁移后旧列置空。
+    每批单独提交，可重复执行。返回迁移的任务数。
+    """
+    last_id, migrated = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(WorkSchedule.id, WorkSchedule.legacy_content)
+            .where(WorkSchedule.id > last_id, WorkSchedule.content_id.is_(None),
+                   WorkSchedule.legacy_content.isnot(None))
+            .order_by(WorkSchedule.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        content_ids = intern_contents([row.legacy_content for row in rows])
+        db.session.execute(
+            update(WorkSchedule).execution_options(synchronize_session=False),
+            [{'id': row.id, 'content_id': content_ids[row.legacy_content], 'legacy_content': None}
+             for row in rows]
+        )
+        db.session.commit()
+        migrated += len(rows)
+        last_id = rows[-1].id
+    return migrated
+
+
+def prune_contents():
+    """
+    删除不再被任何任务（包括回收站中的任务）引用的内容，返回删除的行数。
+    PostgreSQL 上可以在正常使用时执行：正在被 intern_contents 复用的内容已加锁，这里用
+    SKIP LOCKED 跳过。SQLite 不支持行锁，需要在没有写入时执行。
+    """
+    unreferenced = select(TaskContent.id) \
+        .where(~select(WorkSchedule.id).where(WorkSchedule.content_id == TaskContent.id).exists()) \
+        .with_for_update(skip_locked=True)
+    result = db.session.execute(
+        delete(TaskContent).where(TaskContent.id.in_(unreferenced))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,109 @@
+import random
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# 只读副本在 SQLALCHEMY_BINDS 中的键名前缀：replica_0、replica_1 ...
+REPLICA_BIND_PREFIX = 'replica_'
+# 会话 cookie 中记录"读自己的写"截止时间的键
+STICKY_SESSION_KEY = '_db_primary_until'
+# 只有 QueuePool 接受的参数；SQLite 内存库使用 StaticPool，传入会报错
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+def read_only(f):
+    """标记只读视图：未写入过数据的用户访问时，查询可以发送到只读副本。"""
+    f._db_read_only = True
+    return f
+
+
+def using_replica():
+    """当前请求是否在从只读副本读取数据。"""
+    return has_request_context() and g.get('_db_replica') is not None and not g.get('_db_wrote')
+
+
+def engine_options(uri, options):
+    """按数据库类型去掉不适用的连接池参数，返回新的引擎参数字典。"""
+    options = dict(options or {})
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        for name in QUEUE_POOL_OPTIONS:
+            options.pop(name, None)
+    return options
+
+
+class RoutingSession(Session):
+    """
+    按请求选择引擎的会话：标记为只读的请求把查询发送到只读副本，
+    flush、INSERT/UPDATE/DELETE 以及本请求写过数据之后的所有语句都使用主库。
+    后台线程和命令行没有请求上下文，始终使用主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g._db_wrote = True
+            elif using_replica():
+                return self._db.engines[g._db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class DatabaseRouter:
+    """
+    读写分离：把 SQLALCHEMY_REPLICA_URIS 中的副本注册为 Flask-SQLAlchemy 的 bind，
+    为每个请求挑选一个副本（需要配合 RoutingSession 使用）。用户自己写入数据后的
+    DB_READ_YOUR_WRITES_SECONDS 秒内，其请求全部走主库，避免因复制延迟读不到刚保存的内容。
+    必须在 db.init_app 之前初始化。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.replica_binds = []
+        self.sticky_seconds = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        if isinstance(uris, str):
+            uris = [uri.strip() for uri in uris.split(',') if uri.strip()]
+        self.sticky_seconds = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 10)
+
+        base_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        replica_options = {**base_options, **(app.config.get('SQLALCHEMY_REPLICA_ENGINE_OPTIONS') or {})}
+        if app.config.get('SQLALCHEMY_DATABASE_URI'):
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+                app.config['SQLALCHEMY_DATABASE_URI'], base_options)
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.replica_binds = []
+        for index, uri in enumerate(uris):
+            key = f'{REPLICA_BIND_PREFIX}{index}'
+            binds[key] = {'url': uri, **engine_options(uri, replica_options)}
+            self.replica_binds.append(key)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['db_router'] = self
+        if not self.replica_binds:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, '_db_read_only', False):
+            return
+        primary_until = session.get(STICKY_SESSION_KEY)
+        if primary_until:
+            if primary_until > time.time():
+                return
+            session.pop(STICKY_SESSION_KEY, None)
+        g._db_replica = random.choice(self.replica_binds)
+
+    def _after_request(self, response):
+        if g.get('_db_wrote') and self.sticky_seconds:
+            session[STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+        return response
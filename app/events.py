@@ -0,0 +1,192 @@
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只能使用 memory 后端
+    fcntl = None
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout=None):
+        """等待下一条事件，超时返回 None。"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    """进程内发布/订阅，只能通知同一进程中的订阅者。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, event):
+        self._dispatch(channel, event)
+
+    def _dispatch(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # 客户端消费过慢时丢弃事件，客户端重连后会通过增量接口补齐
+                pass
+
+
+class SpoolFileBroker(MemoryBroker):
+    """
+    通过追加写入同一个 JSON Lines 文件在多个进程间转发事件，
+    可作为 Redis 等外部消息代理的本地替代。每个进程只启动一个读取线程，
+    再由它分发给本进程内的订阅者。
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024, poll_interval=0.5):
+        if fcntl is None:
+            raise RuntimeError('SpoolFileBroker 需要 fcntl 支持。')
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._reader_pid = None
+        self._reader_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'a').close()
+
+    def publish(self, channel, event):
+        line = json.dumps({'channel': channel, 'event': event}, ensure_ascii=False) + '\n'
+        with open(self.path, 'a', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if f.tell() > self.max_bytes:
+                    f.truncate(0)
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def subscribe(self, channel):
+        self._ensure_reader()
+        return super().subscribe(channel)
+
+    def _ensure_reader(self):
+        # gunicorn fork 之后线程不会被继承，按进程号判断是否需要重新启动
+        with self._reader_lock:
+            if self._reader_pid == os.getpid():
+                return
+            self._reader_pid = os.getpid()
+            thread = threading.Thread(target=self._tail, name='schedule-events-reader', daemon=True)
+            thread.start()
+
+    def _tail(self):
+        offset = os.path.getsize(self.path)
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                size = os.path.getsize(self.path)
+                if size < offset:
+                    offset = 0  # 文件被截断后从头读取
+                if size == offset:
+                    continue
+                # 与 publish 的排他锁互斥，避免读到截断过程中的文件
+                with open(self.path, 'rb') as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    try:
+                        f.seek(offset)
+                        chunk = f.read()
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            except OSError:
+                continue
+            # 只消费到最后一个换行符，未写完的行留到下一轮重新读取
+            end = chunk.rfind(b'\n') + 1
+            offset += end
+            for line in chunk[:end].splitlines():
+                try:
+                    message = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                self._dispatch(message['channel'], message['event'])
+
+
+class ScheduleEvents:
+    """
+    周计划变更事件的发布入口，频道以周一日期区分。默认关闭；开启后也只在
+    线程或协程 worker 上接受推送连接，同步 worker 上一个连接会占住整个 worker。
+    """
+
+    def __init__(self, app=None):
+        self.broker = None
+        self.process_local = False
+        self.heartbeat = 15
+        self.stream_timeout = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('SCHEDULE_EVENTS_BACKEND', 'null')
+        self.process_local = backend == 'memory'
+        if backend == 'memory':
+            self.broker = MemoryBroker()
+        elif backend == 'file':
+            path = app.config.get('SCHEDULE_EVENTS_SPOOL') or os.path.join(app.instance_path, 'schedule_events.jsonl')
+            self.broker = SpoolFileBroker(path)
+        elif backend in (None, 'null'):
+            self.broker = None
+        else:
+            raise ValueError(f'未知的 SCHEDULE_EVENTS_BACKEND: {backend}')
+        self.heartbeat = app.config.get('SCHEDULE_EVENTS_HEARTBEAT', 15)
+        self.stream_timeout = app.config.get('SCHEDULE_EVENTS_STREAM_TIMEOUT', 300)
+        app.extensions['schedule_events'] = self
+
+    @property
+    def enabled(self):
+        return self.broker is not None
+
+    def accepts_streams(self, environ):
+        """
+        当前服务器能否承载推送连接：需要线程或协程 worker（gunicorn 的 gthread、gevent 等，
+        以及开发服务器），memory 后端还要求只有一个进程，否则其他 worker 发布的事件收不到。
+        """
+        if not self.enabled or not environ.get('wsgi.multithread'):
+            return False
+        return not (self.process_local and environ.get('wsgi.multiprocess'))
+
+    @staticmethod
+    def channel(start_of_week):
+        return f'week:{start_of_week.isoformat()}'
+
+    def publish(self, start_of_week, event):
+        if self.broker is not None:
+            self.broker.publish(self.channel(start_of_week), event)
+
+    def subscribe(self, start_of_week):
+        return self.broker.subscribe(self.channel(start_of_week))
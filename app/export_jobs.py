@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def schedule_data_stamp(start_date, end_date):
+    """日期范围内数据的版本戳，见 exports.schedule_data_version。"""
+    from .exports import schedule_data_version
+
+    count, last_updated = schedule_data_version(start_date, end_date)
+    return f"{count}:{last_updated.isoformat() if last_updated else ''}"
+
+
+def export_cache_key(start_date, end_date, personnel_names, export_format):
+    payload = json.dumps({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'personnel': sorted(personnel_names or []),
+        'format': export_format,
+        'stamp': schedule_data_stamp(start_date, end_date),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ExportJobRunner:
+    """
+    在线程池中生成导出文件，请求线程只负责登记任务并立即返回。
+
+    生成的文件保存在 EXPORT_DIR（默认 instance/exports），以任务 ID 命名；
+    参数和数据版本都相同的请求直接复用已有的任务和文件。
+    登记超过 EXPORT_JOB_TIMEOUT 秒仍未完成的任务视为失败（进程重启或被杀时线程池中的任务会丢失）。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.export_dir = None
+        self.max_workers = 2
+        self.job_timeout = 1800
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.export_dir = app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+        self.max_workers = app.config.get('EXPORT_WORKERS', 2)
+        self.job_timeout = app.config.get('EXPORT_JOB_TIMEOUT', 1800)
+        app.extensions['export_jobs'] = self
+
+    def file_path(self, job):
+        return os.path.join(self.export_dir, job.file_name) if job.file_name else None
+
+    def _mark_stale(self, job):
+        """超时仍未完成的任务标记为失败，返回是否做了修改（不负责提交事务）。"""
+        if job.status not in ('pending', 'running') or job.created_at is None:
+            return False
+        if job.created_at >= datetime.utcnow() - timedelta(seconds=self.job_timeout):
+            return False
+        job.status = 'failed'
+        job.error = '导出超时，请重新提交。'
+        job.finished_at = datetime.utcnow()
+        return True
+
+    def expire_if_stale(self, job):
+        """查询任务状态前调用：超时的任务标记为失败并提交。"""
+        from . import db
+
+        if self._mark_stale(job):
+            db.session.commit()
+        return job
+
+    def find_reusable(self, cache_key):
+        """查找可复用的任务：未超时且正在进行的，或已完成且文件仍然存在的。"""
+        from sqlalchemy import select
+        from . import db
+        from .models import ExportJob
+
+        jobs = db.session.scalars(
+            select(ExportJob)
+            .where(ExportJob.cache_key == cache_key,
+                   ExportJob.status.in_(('pending', 'running', 'done', 'empty')))
+            .order_by(ExportJob.created_at.desc())
+        ).all()
+        reusable, expired = None, False
+        for job in jobs:
+            if self._mark_stale(job):
+                expired = True
+            elif reusable is None and (job.status != 'done' or os.path.exists(self.file_path(job))):
+                reusable = job
+        if expired:
+            db.session.commit()
+        return reusable
+
+    def create(self, user_id, start_date, end_date, personnel_names, export_format):
+        """登记导出任务并提交到线程池，返回 (任务, 是否复用)。"""
+        from . import db
+        from .models import ExportJob
+
+        cache_key = export_cache_key(start_date, end_date, personnel_names, export_format)
+        job = self.find_reusable(cache_key)
+        if job is not None:
+            return job, True
+
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            personnel_filter=json.dumps(personnel_names, ensure_ascii=False) if personnel_names else None,
+            format=export_format,
+            status='pending',
+            cache_key=cache_key,
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._get_executor().submit(self._run, job.id)
+        return job, False
+
+    def _get_executor(self):
+        # gunicorn fork 之后线程池不可用，按进程号判断是否需要重新创建
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='export-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, job_id):
+        from . import db
+        from .exports import EXPORT_FORMATS
+        from .models import ExportJob
+
+        with self.app.app_context():
+            try:
+                job = db.session.get(ExportJob, job_id)
+                if job is None:
+                    return
+                job.status = 'running'
+                db.session.commit()
+
+                writer, extension, _ = EXPORT_FORMATS[job.format]
+                personnel_names = json.loads(job.personnel_filter) if job.personnel_filter else None
+                os.makedirs(self.export_dir, exist_ok=True)
+                file_name = f'{job.id}.{extension}'
+                path = os.path.join(self.export_dir, file_name)
+                # 先写临时文件再改名，下载时不会读到写了一半的文件
+                partial_path = path + '.part'
+                try:
+                    written = writer(partial_path, job.start_date, job.end_date, personnel_names)
+                    if written:
+                        os.replace(partial_path, path)
+                finally:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+
+                job.status = 'done' if written else 'empty'
+                job.file_name = file_name if written else None
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception('导出任务 %s 失败', job_id)
+                job = db.session.get(ExportJob, job_id)
+                if job is not None:
+                    job.status = 'failed'
+                    job.error = str(e)
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+            finally:
+                db.session.remove()
+
+    def cleanup(self, older_than_days):
+        """删除早于 older_than_days 天的导出任务及其文件，返回删除的任务数。"""
+        from datetime import timedelta
+        from sqlalchemy import delete, select
+        from . import db
+        from .models import ExportJob
+
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        jobs = db.session.execute(
+            select(ExportJob.id, ExportJob.file_name).where(ExportJob.created_at < cutoff)
+        ).all()
+        for _, file_name in jobs:
+            if file_name:
+                path = os.path.join(self.export_dir, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+        if jobs:
+            db.session.execute(delete(ExportJob).where(ExportJob.id.in_([job_id for job_id, _ in jobs])))
+            db.session.commit()
+        return len(jobs)
@@ -0,0 +1,331 @@
+import csv
+import html
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+import bleach
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from sqlalchemy import func, select
+from . import db
+from .content import content_html
+from .models import WorkSchedule, TaskAssignment, TaskContent
+
+WEEKDAY_NAMES = ['一', '二', '三', '四', '五', '六', '日']
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+STREAM_CHUNK_SIZE = 64 * 1024
+CSV_MIMETYPE = 'text/csv'
+JSONL_MIMETYPE = 'application/x-ndjson'
+ICS_MIMETYPE = 'text/calendar'
+RECORD_FIELDS = ['id', 'task_date', 'position', 'content', 'content_text', 'personnel', 'version', 'updated_at']
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def schedule_rows_query(start_date, end_date, personnel_names=None):
+    """日期范围内未删除任务的查询；给定 personnel_names 时只保留分配了其中任一人员的任务。"""
+    query = select(WorkSchedule.id, WorkSchedule.task_date, content_html.label('content'), WorkSchedule.position,
+                   WorkSchedule.version, WorkSchedule.updated_at) \
+        .outerjoin(TaskContent, WorkSchedule.content_id == TaskContent.id) \
+        .where(WorkSchedule.is_deleted == False,
+               WorkSchedule.task_date.between(start_date, end_date))
+    if personnel_names:
+        query = query.where(WorkSchedule.id.in_(
+            select(TaskAssignment.task_id).where(TaskAssignment.personnel_name.in_(personnel_names))
+        ))
+    return query.order_by(WorkSchedule.task_date, WorkSchedule.position)
+
+
+def schedule_data_version(start_date, end_date, personnel_names=None):
+    """
+    返回日期范围内数据的 (任务数, 最后修改时间)，包括已删除的任务，
+    任务的新增、修改、删除、恢复都会改变其中一项。
+    """
+    query = select(func.count(WorkSchedule.id), func.max(WorkSchedule.updated_at)) \
+        .where(WorkSchedule.task_date.between(start_date, end_date))
+    if personnel_names:
+        query = query.where(WorkSchedule.id.in_(
+            select(TaskAssignment.task_id).where(TaskAssignment.personnel_name.in_(personnel_names))
+        ))
+    return tuple(db.session.execute(query).one())
+
+
+def _personnel_of(task_ids):
+    personnel = {}
+    for task_id, name in db.session.execute(
+        select(TaskAssignment.task_id, TaskAssignment.personnel_name)
+        .where(TaskAssignment.task_id.in_(task_ids))
+        .order_by(TaskAssignment.task_id, TaskAssignment.position)
+    ):
+        personnel.setdefault(task_id, []).append(name)
+    return personnel
+
+
+def html_to_text(content):
+    """去掉 HTML 标签，保留段落换行，供 CSV/ICS 等纯文本格式使用。"""
+    content = (content or '').replace('</p>', '</p>\n').replace('<br>', '\n')
+    return html.unescape(bleach.clean(content, tags=[], strip=True)).strip()
+
+
+def iter_schedule_records(start_date, end_date, personnel_names=None, batch_size=500):
+    """按日期顺序逐条产出任务记录（字段见 RECORD_FIELDS），每批只查询一次人员分配。"""
+    rows = db.session.execute(
+        schedule_rows_query(start_date, end_date, personnel_names)
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in rows.partitions():
+        personnel = _personnel_of([row.id for row in batch])
+        for row in batch:
+            yield {
+                'id': row.id,
+                'task_date': row.task_date,
+                'position': row.position,
+                'content': row.content,
+                'content_text': html_to_text(row.content),
+                'personnel': personnel.get(row.id, []),
+                'version': row.version,
+                'updated_at': row.updated_at,
+            }
+
+
+def iter_schedule_csv(records):
+    """把任务记录逐块编码为 CSV 文本；带 BOM，Excel 打开时中文不会乱码。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(RECORD_FIELDS)
+    for record in records:
+        writer.writerow([
+            record['id'], record['task_date'].isoformat(), record['position'], record['content'],
+            record['content_text'], ', '.join(record['personnel']), record['version'],
+            record['updated_at'].isoformat() if record['updated_at'] else '',
+        ])
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_schedule_jsonl(records):
+    """把任务记录逐块编码为 JSON Lines，每行一个任务。"""
+    lines, size = [], 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False, default=lambda v: v.isoformat()) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines, size = [], 0
+    if lines:
+        yield ''.join(lines)
+
+
+def _ics_escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ics_fold(line):
+    """按 RFC 5545 把超过 75 字节的行折成以空格开头的续行，不拆开多字节字符。"""
+    parts, current, size = [], '', 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def iter_schedule_ics(personnel_name, start_date, end_date, calendar_name, uid_domain):
+    """某个人员在日期范围内任务的 iCalendar 数据，每个任务是一个全天事件。"""
+    yield _ics_fold('BEGIN:VCALENDAR')
+    yield _ics_fold('VERSION:2.0')
+    yield _ics_fold('PRODID:-//project_management_system//schedule//ZH')
+    yield _ics_fold('CALSCALE:GREGORIAN')
+    yield _ics_fold('X-WR-CALNAME:' + _ics_escape(calendar_name))
+    for record in iter_schedule_records(start_date, end_date, [personnel_name]):
+        text = record['content_text']
+        summary = text.splitlines()[0] if text else '工作任务'
+        description = text + '\n\n人员: ' + ', '.join(record['personnel'])
+        stamp = record['updated_at'].strftime('%Y%m%dT%H%M%SZ') if record['updated_at'] else None
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:task-{record['id']}@{uid_domain}",
+            'DTSTART;VALUE=DATE:' + record['task_date'].strftime('%Y%m%d'),
+            'DTEND;VALUE=DATE:' + (record['task_date'] + timedelta(days=1)).strftime('%Y%m%d'),
+            'SUMMARY:' + _ics_escape(summary),
+            'DESCRIPTION:' + _ics_escape(description),
+            f"SEQUENCE:{record['version'] or 0}",
+        ]
+        if stamp:
+            lines += ['DTSTAMP:' + stamp, 'LAST-MODIFIED:' + stamp]
+        lines.append('END:VEVENT')
+        yield ''.join(_ics_fold(line) for line in lines)
+    yield _ics_fold('END:VCALENDAR')
+
+
+def iter_schedule_weeks(start_date, end_date, personnel_names=None, yield_per=1000):
+    """
+    以服务端游标按日期顺序读取任务，逐周产出 (周一日期, {日期: [(内容, 人员)]})。
+    每次只在内存中保留一周的数据，没有任务的周会被跳过。
+    """
+    rows = db.session.execute(
+        schedule_rows_query(start_date, end_date, personnel_names)
+        .execution_options(yield_per=yield_per)
+    )
+
+    def build_week(week_rows):
+        personnel = _personnel_of([row.id for row in week_rows])
+        days = {}
+        for row in week_rows:
+            days.setdefault(row.task_date, []).append((row.content, ", ".join(personnel.get(row.id, []))))
+        return days
+
+    current_week, week_rows = None, []
+    for row in rows:
+        row_week = _week_start(row.task_date)
+        if row_week != current_week and week_rows:
+            yield current_week, build_week(week_rows)
+            week_rows = []
+        current_week = row_week
+        week_rows.append(row)
+    if week_rows:
+        yield current_week, build_week(week_rows)
+
+
+def _register_styles(workbook):
+    thin_side = Side(style='thin', color="000000")
+    full_border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+    alignment = Alignment(wrap_text=True, vertical='top')
+    band_fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")
+
+    styles = [NamedStyle(name='schedule_header', font=Font(bold=True), border=full_border)]
+    for banded in (False, True):
+        suffix = '_band' if banded else ''
+        fill = band_fill if banded else PatternFill()
+        styles.append(NamedStyle(name=f'schedule_content{suffix}', font=Font(bold=True),
+                                 border=full_border, alignment=alignment, fill=fill))
+        styles.append(NamedStyle(name=f'schedule_personnel{suffix}',
+                                 border=full_border, alignment=alignment, fill=fill))
+    for style in styles:
+        workbook.add_named_style(style)
+
+
+def _write_week_sheet(workbook, title, week_start, days):
+    week_dates = [week_start + timedelta(days=i) for i in range(7)]
+    sheet = workbook.create_sheet(title=title)
+    for col_idx in range(1, len(week_dates) + 1):
+        sheet.column_dimensions[get_column_letter(col_idx)].width = 40
+
+    def styled(value, style):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style
+        return cell
+
+    sheet.append([
+        styled(day.strftime('%Y-%m-%d') + " (星期" + WEEKDAY_NAMES[day.weekday()] + ")", 'schedule_header')
+        for day in week_dates
+    ])
+
+    # 每个任务占两行：内容行（加粗）和人员行，按任务序号隔行加底色
+    columns = [[value for task in days.get(day, []) for value in task] for day in week_dates]
+    max_rows = max(len(column) for column in columns)
+    for row_idx in range(max_rows):
+        band = '_band' if (row_idx // 2) % 2 == 1 else ''
+        kind = 'schedule_content' if row_idx % 2 == 0 else 'schedule_personnel'
+        sheet.append([
+            styled(column[row_idx] if row_idx < len(column) else '', kind + band)
+            for column in columns
+        ])
+
+
+def write_schedule_workbook(path, start_date, end_date, personnel_names=None, sheet_title=None):
+    """
+    以 openpyxl 只写模式把日期范围内的任务写入 path，每周一个工作表，返回写入的周数。
+    sheet_title 仅在导出单周时使用，多周时以周一日期命名工作表。
+    """
+    workbook = Workbook(write_only=True)
+    _register_styles(workbook)
+    weeks = 0
+    for week_start, days in iter_schedule_weeks(start_date, end_date, personnel_names):
+        title = sheet_title or week_start.strftime('%Y-%m-%d')
+        _write_week_sheet(workbook, title, week_start, days)
+        weeks += 1
+    if weeks:
+        workbook.save(path)
+    return weeks
+
+
+def build_schedule_workbook(start_date, end_date, personnel_names=None, sheet_title=None):
+    """生成到临时文件，返回 (文件路径, 周数)；没有数据时返回 (None, 0)。"""
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        weeks = write_schedule_workbook(path, start_date, end_date, personnel_names, sheet_title)
+    except Exception:
+        os.remove(path)
+        raise
+    if not weeks:
+        os.remove(path)
+        return None, 0
+    return path, weeks
+
+
+def stream_file(path):
+    """分块读取文件作为响应体。"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def remove_file(path):
+    """删除临时文件，文件已不存在时忽略。"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+
+def _write_records(encoder, path, start_date, end_date, personnel_names=None):
+    """把编码后的任务记录写入 path，返回任务数。"""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in iter_schedule_records(start_date, end_date, personnel_names):
+            count += 1
+            yield record
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in encoder(counted()):
+            f.write(chunk)
+    return count
+
+
+def write_schedule_csv(path, start_date, end_date, personnel_names=None):
+    return _write_records(iter_schedule_csv, path, start_date, end_date, personnel_names)
+
+
+def write_schedule_jsonl(path, start_date, end_date, personnel_names=None):
+    return _write_records(iter_schedule_jsonl, path, start_date, end_date, personnel_names)
+
+
+# 后台导出任务可用的格式：格式名 -> (写入函数, 文件扩展名, MIME 类型)
+EXPORT_FORMATS = {
+    'xlsx': (write_schedule_workbook, 'xlsx', XLSX_MIMETYPE),
+    'csv': (write_schedule_csv, 'csv', CSV_MIMETYPE),
+    'jsonl': (write_schedule_jsonl, 'jsonl', JSONL_MIMETYPE),
+}
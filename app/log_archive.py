@@ -0,0 +1,108 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text,
+                        delete, inspect, insert, select, union_all)
+from . import db
+from .models import ActivityLog
+
+ARCHIVE_TABLE_PREFIX = 'activity_log_archive_'
+
+# 归档表不属于模型，单独放在一个 MetaData 中，避免 create_all 和迁移脚本处理它们
+archive_metadata = MetaData()
+
+_table_names_lock = threading.Lock()
+_table_names_cache = {'expires_at': 0, 'names': []}
+TABLE_NAMES_TTL = 300
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """供 Flask-Migrate 使用：自动生成迁移时忽略按月创建的归档表。"""
+    return not (type_ == 'table' and name.startswith(ARCHIVE_TABLE_PREFIX))
+
+
+def archive_table(month_key):
+    """返回 month_key（形如 202401）对应的归档表定义。"""
+    name = f'{ARCHIVE_TABLE_PREFIX}{month_key}'
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    return Table(
+        name, archive_metadata,
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('user_id', Integer, nullable=False),
+        Column('action', String(100), nullable=False),
+        Column('details', Text, nullable=True),
+        Column('timestamp', DateTime),
+        Index(f'ix_{name}_timestamp_id', 'timestamp', 'id'),
+    )
+
+
+def archive_month_keys(refresh=False):
+    """列出数据库中已有的归档月份（降序），结果在进程内缓存几分钟。"""
+    with _table_names_lock:
+        if refresh or _table_names_cache['expires_at'] < time.monotonic():
+            names = inspect(db.engine).get_table_names()
+            _table_names_cache['names'] = sorted(
+                (n[len(ARCHIVE_TABLE_PREFIX):] for n in names if n.startswith(ARCHIVE_TABLE_PREFIX)),
+                reverse=True
+            )
+            _table_names_cache['expires_at'] = time.monotonic() + TABLE_NAMES_TTL
+        return list(_table_names_cache['names'])
+
+
+def archive_activity_logs(older_than_days, batch_size=5000):
+    """
+    把早于 older_than_days 天的日志分批移动到按月划分的归档表。
+    每批在单独的事务中完成“复制 + 删除”，避免长事务和长时间锁表。返回移动的行数。
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    log_table = ActivityLog.__table__
+    moved = 0
+
+    while True:
+        rows = db.session.execute(
+            select(log_table)
+            .where(log_table.c.timestamp < cutoff)
+            .order_by(log_table.c.timestamp, log_table.c.id)
+            .limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row['timestamp'].strftime('%Y%m'), []).append(dict(row))
+        for month_key, month_rows in by_month.items():
+            table = archive_table(month_key)
+            table.create(db.session.connection(), checkfirst=True)
+            db.session.execute(insert(table), month_rows)
+
+        db.session.execute(delete(log_table).where(log_table.c.id.in_([row['id'] for row in rows])))
+        db.session.commit()
+        moved += len(rows)
+
+    archive_month_keys(refresh=True)
+    return moved
+
+
+def activity_log_source(include_archived=False, date_from=None, date_to=None):
+    """
+    返回日志查询的数据源。包含归档时把热表和日期范围内的归档表 UNION ALL 起来，
+    筛选条件和排序可以下推到各个分支的 (timestamp, id) 索引上。
+    """
+    log_table = ActivityLog.__table__
+    if not include_archived:
+        return log_table
+
+    columns = ['id', 'user_id', 'action', 'details', 'timestamp']
+    selects = [select(*[log_table.c[name] for name in columns])]
+    for month_key in archive_month_keys():
+        month_start = datetime.strptime(month_key, '%Y%m')
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        if (date_from and month_end <= date_from) or (date_to and month_start >= date_to):
+            continue
+        table = archive_table(month_key)
+        selects.append(select(*[table.c[name] for name in columns]))
+    if len(selects) == 1:
+        return log_table
+    return union_all(*selects).subquery('activity_log_all')
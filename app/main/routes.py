@@ -1,31 +1,47 @@
-import pandas as pd
-from io import BytesIO
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+import os
 from flask import (render_template, request, jsonify, redirect, 
-                   url_for, flash, Response, make_response)
+                   url_for, flash, Response, current_app, abort, send_file, stream_with_context)
 from flask_login import login_required, current_user
 from datetime import date, timedelta, datetime
-from sqlalchemy import and_, func, case
-import openpyxl
+import functools
+import hashlib
 import json
+import time
+import uuid
 import bleach
+from itsdangerous import BadSignature, URLSafeSerializer
 
 from . import main_bp
-from app import db
-from app.models import WorkSchedule, ActivityLog, Personnel, TaskAssignment
+from app import db, schedule_cache, schedule_events, activity_log_writer, export_jobs
+from app.models import WorkSchedule, Personnel, TaskAssignment, User, ExportJob
+from app.pagination import keyset_paginate, approximate_count
+from app.log_archive import activity_log_source
+from app.analytics import build_workload_report, BUCKET_DAY, BUCKET_WEEK
+from app.search import refresh_search_text, parse_terms, search_query, highlight
+from app.trash import trash_query, restore_tasks, purge_tasks, MAX_BULK_IDS
+from app.batch import apply_batch
+from app.exports import html_to_text
+from app.exports import (build_schedule_workbook, stream_file, remove_file, XLSX_MIMETYPE, EXPORT_FORMATS,
+                         iter_schedule_records, iter_schedule_csv, iter_schedule_jsonl, iter_schedule_ics,
+                         schedule_data_version, ICS_MIMETYPE)
 from app.utils import log_activity
 from app.decorators import permission_required, admin_required
+from app.db_routing import read_only
+from app.schedule import (resolve_task_range, expand_recurrence, bulk_create_tasks, resolve_personnel_ids,
+                          build_week_payload, fetch_changes_since, notify_schedule_change,
+                          copy_tasks, shift_tasks, day_task_versions, move_task, day_counts_query,
+                          RECURRENCE_DAILY, CHANGES_LIMIT)
 
 # --- HTML 清洗配置 ---
 ALLOWED_TAGS = ['p', 'b', 'strong', 'i', 'em', 'span', 'br']
 ALLOWED_ATTRIBUTES = {'span': ['style']}
 ALLOWED_STYLES = ['color']
 
-def sanitize_html(html_content):
-    """使用 Bleach 清洗用户输入的 HTML，防止 XSS 攻击。"""
-    if not html_content:
-        return ""
+# 以原始输入为键缓存清洗结果，保存未修改的内容时不必再次解析
+SANITIZE_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=SANITIZE_CACHE_SIZE)
+def _clean_html(html_content):
     return bleach.clean(
         html_content,
         tags=ALLOWED_TAGS,
@@ -33,6 +49,12 @@ def sanitize_html(html_content):
         styles=ALLOWED_STYLES,
         strip=True
     ).strip()
+
+def sanitize_html(html_content):
+    """使用 Bleach 清洗用户输入的 HTML，防止 XSS 攻击。"""
+    if not html_content:
+        return ""
+    return _clean_html(html_content)
 # --------------------
 
 
@@ -48,6 +70,19 @@ def get_week_dates(start_date_str=None):
     start_of_week = base_date - timedelta(days=base_date.weekday())
     return [start_of_week + timedelta(days=i) for i in range(7)]
 
+def wants_json():
+    return request.accept_mimetypes.accept_json and \
+        not request.accept_mimetypes.accept_html
+
+def get_week_payload(week_dates):
+    """从缓存读取一周的数据，未命中时查询数据库并写回缓存。返回 (数据, 缓存代号)。"""
+    payload, generation = schedule_cache.get_week(week_dates[0])
+    if payload is None:
+        payload = build_week_payload(week_dates)
+        schedule_cache.set_week(week_dates[0], payload, generation)
+    return payload, generation
+
+# 周视图返回的水位线是增量接口的起点，必须和数据一样来自主库，不能标记为只读
 @main_bp.route('/')
 @login_required
 def index():
@@ -60,22 +95,25 @@ def index():
     current_week_start = today - timedelta(days=today.weekday())
     is_current_week = (start_of_week == current_week_start)
 
-    tasks = WorkSchedule.query.filter(
-        WorkSchedule.is_deleted == False, # 过滤掉已删除的任务
-        WorkSchedule.task_date.between(start_of_week, end_of_week)
-    ).order_by(WorkSchedule.task_date, WorkSchedule.position).all()
-    
-    personnel_list = Personnel.query.order_by(Personnel.name).all()
-    
-    schedule_by_day = {day: [] for day in week_dates}
-    for task in tasks:
-        if task.task_date in schedule_by_day:
-            schedule_by_day[task.task_date].append(task)
-        
-    # 判断周末是否有任务，用于前端提示
-    saturday_date = week_dates[5]
-    sunday_date = week_dates[6]
-    weekend_has_tasks = len(schedule_by_day[saturday_date]) > 0 or len(schedule_by_day[sunday_date]) > 0
+    payload, generation = get_week_payload(week_dates)
+
+    # 表格片段中的按钮取决于当前用户权限，按权限组合分别缓存
+    variant = ''.join('1' if getattr(current_user, name) else '0'
+                      for name in ('is_admin', 'can_add', 'can_edit', 'can_delete'))
+    week_table = schedule_cache.get_fragment(start_of_week, variant, generation)
+    if week_table is None:
+        week_table = render_template(
+            'main/_week_table.html',
+            week_dates=week_dates,
+            schedule_by_day=payload['days'],
+            weekend_has_tasks=payload['weekend_has_tasks']
+        )
+        schedule_cache.set_fragment(start_of_week, variant, generation, week_table)
+
+    personnel_names = schedule_cache.get_personnel()
+    if personnel_names is None:
+        personnel_names = [p.name for p in Personnel.query.order_by(Personnel.name).all()]
+        schedule_cache.set_personnel(personnel_names)
         
     prev_week_start = start_of_week - timedelta(days=7)
     next_week_start = start_of_week + timedelta(days=7)
@@ -85,17 +123,24 @@ def index():
 
     return render_template(
         'main/index.html', 
-        schedule_by_day=schedule_by_day,
+        week_table=week_table,
         week_dates=week_dates,
-        personnel_list=personnel_list,
+        personnel_names=personnel_names,
+        watermark=payload['watermark'],
         prev_week=prev_week_start.strftime('%Y-%m-%d'),
         next_week=next_week_start.strftime('%Y-%m-%d'),
         is_current_week=is_current_week,
         page_main_title=page_main_title,
-        page_date_range=page_date_range,
-        weekend_has_tasks=weekend_has_tasks
+        page_date_range=page_date_range
     )
 
+def add_task_failed(message, start_date_str=None, category='danger'):
+    """add_task 的错误出口：前端以 JSON 方式提交时返回 400，否则闪现消息并跳回周视图。"""
+    if wants_json():
+        return jsonify({'success': False, 'error': message}), 400
+    flash(message, category)
+    return redirect(url_for('main.index', start_date=start_date_str))
+
 @main_bp.route('/add_task', methods=['POST'])
 @login_required
 @permission_required('can_add')
@@ -114,63 +159,153 @@ def add_task():
         personnel_names = []
 
     if not all([start_date_str, sanitized_content, personnel_names]):
-        flash('开始日期、工作内容和人员均为必填项。', 'danger')
-        return redirect(url_for('main.index'))
+        return add_task_failed('开始日期、工作内容和人员均为必填项。')
 
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
     except ValueError:
-        flash('日期格式不正确。', 'danger')
-        return redirect(url_for('main.index', start_date=start_date_str))
+        return add_task_failed('日期格式不正确。', start_date_str)
 
-    current_date = start_date
-    while current_date <= end_date:
-        max_pos = db.session.query(func.max(WorkSchedule.position)).filter_by(task_date=current_date, is_deleted=False).scalar() or -1
-        new_task = WorkSchedule(
-            task_date=current_date,
-            content=sanitized_content,
-            author_id=current_user.id,
-            position=max_pos + 1
-        )
-        for index, name in enumerate(personnel_names):
-            assignment = TaskAssignment(personnel_name=name, position=index)
-            new_task.assignments.append(assignment)
-        db.session.add(new_task)
-        current_date += timedelta(days=1)
+    recurrence = request.form.get('recurrence') or RECURRENCE_DAILY
+    interval_days = request.form.get('interval_days', 1, type=int)
+    try:
+        task_dates = expand_recurrence(start_date, end_date, recurrence, interval_days)
+    except ValueError as e:
+        return add_task_failed(str(e), start_date_str)
+
+    if not task_dates:
+        return add_task_failed('所选日期范围内没有符合重复规则的日期。', start_date_str, 'warning')
+
+    series_id = uuid.uuid4().hex if len(task_dates) > 1 else None
+    task_ids = bulk_create_tasks(task_dates, sanitized_content, personnel_names, current_user.id, series_id)
     
     db.session.commit()
+    notify_schedule_change('created', task_ids, task_dates)
     log_activity('创建任务', f"为日期 {start_date_str} 到 {end_date_str} 添加了任务: '{sanitized_content}'")
+    if wants_json():
+        return jsonify({'success': True, 'message': '新任务已添加。', 'task_ids': task_ids})
     flash('新任务已添加。', 'success')
         
     return redirect(url_for('main.index', start_date=start_date_str))
 
+def get_month_range(start_date_str=None, weeks=None):
+    """
+    月视图的日期范围，返回 (周一列表, 所在月份的第一天或 None, 上一页日期, 下一页日期)。
+    未指定 weeks 时显示 start_date 所在的整月；指定时从 start_date 所在周起连续显示 weeks 周。
+    """
+    if weeks:
+        max_weeks = current_app.config.get('MONTH_VIEW_MAX_WEEKS', 8)
+        weeks = min(max(weeks, 1), max_weeks)
+        first_week = get_week_dates(start_date_str)[0]
+        week_starts = [first_week + timedelta(days=7 * i) for i in range(weeks)]
+        return week_starts, None, week_starts[0] - timedelta(days=7 * weeks), week_starts[-1] + timedelta(days=7)
+
+    try:
+        base_date = datetime.strptime(start_date_str or '', '%Y-%m-%d').date()
+    except ValueError:
+        base_date = date.today()
+    first_day = base_date.replace(day=1)
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+    last_day = next_month - timedelta(days=1)
+    week_start = first_day - timedelta(days=first_day.weekday())
+    week_starts = []
+    while week_start <= last_day:
+        week_starts.append(week_start)
+        week_start += timedelta(days=7)
+    prev_month = (first_day - timedelta(days=1)).replace(day=1)
+    return week_starts, first_day, prev_month, next_month
+
+@main_bp.route('/month')
+@read_only
+@login_required
+def month():
+    """
+    月视图 / 多周视图：服务端只用一次分组查询渲染每天的任务数，
+    任务详情由前端在滚动到对应周时通过 /api/schedule 按周加载。
+    """
+    weeks = request.args.get('weeks', type=int)
+    week_starts, month_start, prev_start, next_start = get_month_range(request.args.get('start_date'), weeks)
+    end_date = week_starts[-1] + timedelta(days=6)
+    day_counts = dict(day_counts_query(week_starts[0], end_date).all())
+
+    calendar_weeks = [
+        [(week_start + timedelta(days=i), day_counts.get(week_start + timedelta(days=i), 0)) for i in range(7)]
+        for week_start in week_starts
+    ]
+    if month_start:
+        title = f"{month_start.year} 年 {month_start.month} 月"
+    else:
+        title = f"{week_starts[0].strftime('%Y-%m-%d')} 起 {len(week_starts)} 周"
+    return render_template(
+        'main/month.html',
+        title=title,
+        calendar_weeks=calendar_weeks,
+        month_start=month_start,
+        weeks=weeks if not month_start else None,
+        prev_start=prev_start.strftime('%Y-%m-%d'),
+        next_start=next_start.strftime('%Y-%m-%d'),
+        total_tasks=sum(day_counts.values()),
+        today=date.today()
+    )
+
+@main_bp.route('/api/schedule')
+@login_required
+def api_week_schedule():
+    week_dates = get_week_dates(request.args.get('start_date'))
+    return jsonify(get_week_payload(week_dates)[0])
+
+@main_bp.route('/api/schedule/changes')
+@login_required
+def api_schedule_changes():
+    try:
+        since = datetime.fromisoformat(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'success': False, 'error': '无效的水位线。'}), 400
+
+    # 客户端传入正在查看的周和页面上的任务 id，只返回与这一周有关的变更
+    week_dates = get_week_dates(request.args['start_date']) if request.args.get('start_date') else None
+    task_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()][:CHANGES_LIMIT]
+    changes, watermark = fetch_changes_since(since, week_dates, task_ids)
+    if changes is None:
+        return jsonify({'reset': True, 'watermark': watermark.isoformat()})
+    return jsonify({'reset': False, 'changes': changes, 'watermark': watermark.isoformat()})
+
+@main_bp.route('/api/schedule/stream')
+@login_required
+def api_schedule_stream():
+    """以 Server-Sent Events 推送某一周的任务变更，客户端收到后调用增量接口刷新。"""
+    # 返回 204 时浏览器的 EventSource 不再重连
+    if not schedule_events.accepts_streams(request.environ):
+        return Response(status=204)
+
+    start_of_week = get_week_dates(request.args.get('start_date'))[0]
+    heartbeat = schedule_events.heartbeat
+    deadline = time.monotonic() + schedule_events.stream_timeout
+
+    def stream():
+        subscription = schedule_events.subscribe(start_of_week)
+        try:
+            yield 'retry: 3000\n\n'
+            # 连接达到时长上限后主动断开，由浏览器自动重连，避免长期占用 worker
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ': heartbeat\n\n'
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @main_bp.route('/api/get_task_with_range/<int:task_id>')
 @login_required
 def get_task_with_range(task_id):
     task = WorkSchedule.query.filter_by(id=task_id, is_deleted=False).first_or_404()
-    personnel_set = set(a.personnel_name for a in task.assignments)
-    
-    start_date = task.task_date
-    current_date = task.task_date - timedelta(days=1)
-    while True:
-        prev_task = WorkSchedule.query.filter_by(task_date=current_date, content=task.content, is_deleted=False).first()
-        if prev_task and set(a.personnel_name for a in prev_task.assignments) == personnel_set:
-            start_date = current_date
-            current_date -= timedelta(days=1)
-        else:
-            break
-            
-    end_date = task.task_date
-    current_date = task.task_date + timedelta(days=1)
-    while True:
-        next_task = WorkSchedule.query.filter_by(task_date=current_date, content=task.content, is_deleted=False).first()
-        if next_task and set(a.personnel_name for a in next_task.assignments) == personnel_set:
-            end_date = current_date
-            current_date += timedelta(days=1)
-        else:
-            break
-            
+    start_date, end_date = resolve_task_range(task)
+
     return jsonify({
         'id': task.id,
         'content': task.content,
@@ -202,15 +337,22 @@ def update_task(task_id):
             }
         }), 409
 
-    raw_content = data.get('content', task.content)
-    task.content = sanitize_html(raw_content)
+    original_date = task.task_date
+    if 'content' in data:
+        sanitized_content = sanitize_html(data['content'])
+        # 内容未变化时不改动内容引用
+        if sanitized_content != task.content:
+            task.content = sanitized_content
     
     personnel_data = data.get('personnel', None)
     if personnel_data is not None and isinstance(personnel_data, list):
         task.assignments.clear()
         personnel_names = [item['value'] for item in personnel_data if isinstance(item, dict) and item.get('value')]
+        personnel_ids = resolve_personnel_ids(personnel_names)
         for index, name in enumerate(personnel_names):
-            task.assignments.append(TaskAssignment(personnel_name=name, position=index))
+            task.assignments.append(TaskAssignment(personnel_id=personnel_ids.get(name),
+                                                   personnel_name=name, position=index))
+    refresh_search_text(task)
     
     new_date_str = data.get('task_date')
     if new_date_str:
@@ -221,6 +363,7 @@ def update_task(task_id):
 
     task.version += 1
     db.session.commit()
+    notify_schedule_change('updated', [task.id], [original_date, task.task_date])
     log_activity('更新任务', f"更新了任务ID {task_id}，内容: '{task.content}'")
     return jsonify({'success': True, 'message': '任务已更新。'})
 
@@ -228,47 +371,158 @@ def update_task(task_id):
 @login_required
 @permission_required('can_edit')
 def reorder_tasks():
-    data = request.get_json()
+    """
+    拖动排序。客户端提交被移动的任务，以及移出和移入的两天各自的任务列表 [{id, version}]（移动后的顺序）。
+    只有这两天的任务与服务器一致时才执行，且只修改被移动的任务，其余任务的版本号不变。
+    """
+    data = request.get_json(silent=True) or {}
     moved_task_data = data.get('moved_task')
     target_list_data = data.get('target_list')
+    source_list_data = data.get('source_list')
 
     if not moved_task_data or not target_list_data:
         return jsonify({'success': False, 'error': '请求数据不完整。'}), 400
 
-    moved_task_id = moved_task_data['id']
-    client_version = moved_task_data['version']
+    try:
+        moved_task_id = int(moved_task_data['id'])
+        client_version = int(moved_task_data['version'])
+        new_date = datetime.strptime(target_list_data.get('date') or '', '%Y-%m-%d').date()
+        target_tasks = [(int(t['id']), int(t['version'])) for t in target_list_data.get('tasks', [])]
+        source_date = datetime.strptime(source_list_data['date'], '%Y-%m-%d').date() if source_list_data else None
+        source_tasks = [(int(t['id']), int(t['version'])) for t in source_list_data.get('tasks', [])] \
+            if source_list_data else []
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'error': '请求数据不完整。'}), 400
+
+    target_ids = [task_id for task_id, _ in target_tasks]
+    if moved_task_id not in target_ids or len(set(target_ids)) != len(target_ids):
+        return jsonify({'success': False, 'error': '请求数据不完整。'}), 400
 
-    moved_task_db = WorkSchedule.query.get(moved_task_id)
-    if not moved_task_db or moved_task_db.version != client_version:
+    moved_task_db = db.session.get(WorkSchedule, moved_task_id)
+    conflict = not moved_task_db or moved_task_db.is_deleted or moved_task_db.version != client_version
+    if not conflict:
+        # 目标日期的其他任务（含顺序）必须与客户端看到的一致，否则算不出正确的位置
+        current_target = [(task_id, version) for task_id, version, _ in day_task_versions(new_date, moved_task_id)]
+        conflict = current_target != [item for item in target_tasks if item[0] != moved_task_id]
+    if not conflict and source_date is not None and source_date != new_date:
+        current_source = {(task_id, version) for task_id, version, _ in day_task_versions(source_date, moved_task_id)}
+        conflict = source_date != moved_task_db.task_date or \
+            current_source != {item for item in source_tasks if item[0] != moved_task_id}
+    if conflict:
         return jsonify({'success': False, 'error': '操作失败，任务已被他人修改。请刷新页面后重试。', 'conflict': True}), 409
 
     try:
-        new_date_str = target_list_data.get('date')
-        new_date = datetime.strptime(new_date_str, '%Y-%m-%d').date()
-        if moved_task_db.task_date != new_date:
-            moved_task_db.task_date = new_date
-
-        all_task_ids = [t['id'] for t in data.get('all_tasks_in_view', [])]
-        db.session.query(WorkSchedule).filter(WorkSchedule.id.in_(all_task_ids)).update(
-            {'version': WorkSchedule.version + 1}, synchronize_session=False
-        )
-
-        target_ids = target_list_data.get('task_ids', [])
-        if target_ids:
-            target_case = case({int(tid): i for i, tid in enumerate(target_ids)}, value=WorkSchedule.id)
-            db.session.query(WorkSchedule).filter(WorkSchedule.id.in_(target_ids)).update(
-                {'position': target_case}, synchronize_session=False
-            )
-        
+        original_date = moved_task_db.task_date
+        position, version = move_task(moved_task_db, new_date, target_ids)
         db.session.commit()
+        notify_schedule_change('moved', [moved_task_id], [original_date, new_date])
         log_activity('拖拽任务', f"移动了任务ID {moved_task_id}")
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'position': position, 'version': version})
 
     except Exception as e:
         db.session.rollback()
         log_activity('拖拽任务失败', f"任务ID {moved_task_id} 移动失败: {str(e)}")
         return jsonify({'success': False, 'error': '数据库操作失败。'}), 500
 
+@main_bp.route('/api/tasks/batch', methods=['POST'])
+@login_required
+def batch_tasks():
+    """
+    批量修改任务：operations 中每项为 update / delete / restore / move 之一，
+    逐项做权限和版本检查，全部用批量 SQL 执行并只提交一次。
+    atomic 默认为真，任何一项失败时整批都不执行。
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations or \
+            not all(isinstance(operation, dict) for operation in operations):
+        return jsonify({'success': False, 'error': 'operations 必须是非空列表。'}), 400
+    max_operations = current_app.config.get('BATCH_MAX_OPERATIONS', 500)
+    if len(operations) > max_operations:
+        return jsonify({'success': False, 'error': f'一次最多提交 {max_operations} 项操作。'}), 400
+
+    atomic = bool(data.get('atomic', True))
+    try:
+        results, applied, changed = apply_batch(operations, current_user, sanitize_html, atomic)
+        if applied:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log_activity('批量修改任务失败', f"{len(operations)} 项操作执行失败: {str(e)}")
+        return jsonify({'success': False, 'error': '数据库操作失败。'}), 500
+
+    all_ok = all(result['status'] == 'ok' for result in results)
+    if not applied:
+        status = 409 if any(result['status'] == 'conflict' for result in results) else 400
+        return jsonify({'success': False, 'error': '批量操作未执行，请检查每项结果。', 'results': results}), status
+
+    for kind, items in changed.items():
+        notify_schedule_change(kind, [item[0] for item in items], [day for item in items for day in item[1:]])
+    summary = '，'.join(f"{kind} {len(items)} 项" for kind, items in changed.items())
+    log_activity('批量修改任务', f"批量操作了 {sum(len(items) for items in changed.values())} 个任务（{summary}）: "
+                               f"{[item[0] for items in changed.values() for item in items]}")
+    return jsonify({'success': all_ok, 'results': results})
+
+def parse_range_payload(data, start_key, end_key):
+    """从 JSON 请求体中解析日期区间，返回 (start, end)；格式不对时抛出 ValueError。"""
+    try:
+        start_date = datetime.strptime(data.get(start_key) or '', '%Y-%m-%d').date()
+        end_date = datetime.strptime(data.get(end_key) or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('无效的日期格式')
+    return start_date, end_date
+
+@main_bp.route('/api/schedule/copy', methods=['POST'])
+@login_required
+@permission_required('can_add')
+def copy_schedule():
+    """把一段日期（通常是一周）内的任务整体复制到以 target_start 开始的日期。"""
+    data = request.get_json(silent=True) or {}
+    try:
+        start_date, end_date = parse_range_payload(data, 'start_date', 'end_date')
+        target_start = datetime.strptime(data.get('target_start') or '', '%Y-%m-%d').date()
+        task_ids, target_dates = copy_tasks(start_date, end_date, (target_start - start_date).days, current_user.id)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        log_activity('复制任务失败', f"复制 {start_date} 到 {end_date} 的任务失败: {str(e)}")
+        return jsonify({'success': False, 'error': '数据库操作失败。'}), 500
+
+    if task_ids:
+        notify_schedule_change('created', task_ids, target_dates)
+        log_activity('复制任务', f"将 {start_date} 到 {end_date} 的 {len(task_ids)} 个任务复制到 {target_start} 开始的日期")
+    return jsonify({'success': True, 'count': len(task_ids), 'task_ids': task_ids})
+
+@main_bp.route('/api/schedule/shift', methods=['POST'])
+@login_required
+@permission_required('can_edit')
+def shift_schedule():
+    """把一段日期内的任务整体平移 days 天（可为负数）。"""
+    data = request.get_json(silent=True) or {}
+    try:
+        start_date, end_date = parse_range_payload(data, 'start_date', 'end_date')
+        days = data.get('days')
+        if not isinstance(days, int) or isinstance(days, bool):
+            raise ValueError('平移天数必须是整数。')
+        moved = shift_tasks(start_date, end_date, days)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        log_activity('平移任务失败', f"平移 {start_date} 到 {end_date} 的任务失败: {str(e)}")
+        return jsonify({'success': False, 'error': '数据库操作失败。'}), 500
+
+    if moved:
+        notify_schedule_change('moved', [task_id for task_id, _, _ in moved],
+                               [day for _, old_date, new_date in moved for day in (old_date, new_date)])
+        log_activity('平移任务', f"将 {start_date} 到 {end_date} 的 {len(moved)} 个任务平移 {days} 天")
+    return jsonify({'success': True, 'count': len(moved)})
+
 @main_bp.route('/api/delete_task/<int:task_id>', methods=['POST'])
 @login_required
 @permission_required('can_delete')
@@ -276,7 +530,9 @@ def api_delete_task(task_id):
     task = WorkSchedule.query.get_or_404(task_id)
     task.is_deleted = True
     task.deleted_at = datetime.utcnow()
+    task.deleted_by_id = current_user.id
     db.session.commit()
+    notify_schedule_change('deleted', [task.id], [task.task_date])
     log_activity('软删除任务', f"软删除了任务ID {task_id}, 内容: '{task.content}'")
     return jsonify({'success': True, 'message': '任务已删除。', 'task_id': task.id})
 
@@ -288,12 +544,91 @@ def restore_task(task_id):
     if task.is_deleted:
         task.is_deleted = False
         task.deleted_at = None
+        task.deleted_by_id = None
         db.session.commit()
+        notify_schedule_change('restored', [task.id], [task.task_date])
         log_activity('恢复任务', f"恢复了任务ID {task_id}, 内容: '{task.content}'")
         return jsonify({'success': True, 'message': '任务已恢复。'})
     return jsonify({'success': False, 'error': '任务未被删除。'}), 400
 
+@main_bp.route('/trash')
+@read_only
+@login_required
+@permission_required('can_add')
+def trash():
+    filters = {
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+        'deleted_by': request.args.get('deleted_by', type=int),
+    }
+    try:
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date() if filters['date_from'] else None
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date() if filters['date_to'] else None
+    except ValueError:
+        flash('日期格式不正确。', 'danger')
+        return redirect(url_for('main.trash'))
+
+    query = trash_query(date_from, date_to, filters['deleted_by'])
+    page = keyset_paginate(query, [WorkSchedule.deleted_at, WorkSchedule.id],
+                           after=request.args.get('after'), before=request.args.get('before'), per_page=50)
+    active_filters = {key: value for key, value in filters.items() if value}
+    users = User.query.order_by(User.username).all()
+    return render_template('main/trash.html', title='回收站', page=page, filters=filters,
+                           active_filters=active_filters, users=users,
+                           retention_days=current_app.config.get('TRASH_RETENTION_DAYS', 30))
+
+def get_bulk_task_ids():
+    """从 JSON 请求体中读取 task_ids，返回 (id 列表, 错误信息)。"""
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get('task_ids')
+    if not isinstance(task_ids, list) or not task_ids:
+        return None, '请选择任务。'
+    if len(task_ids) > MAX_BULK_IDS:
+        return None, f'一次最多处理 {MAX_BULK_IDS} 个任务。'
+    try:
+        return sorted({int(task_id) for task_id in task_ids}), None
+    except (TypeError, ValueError):
+        return None, '任务 ID 无效。'
+
+@main_bp.route('/api/trash/restore', methods=['POST'])
+@login_required
+@permission_required('can_add')
+def api_trash_restore():
+    task_ids, error = get_bulk_task_ids()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    restored = restore_tasks(task_ids)
+    db.session.commit()
+    if restored:
+        notify_schedule_change('restored', [task_id for task_id, _ in restored], [day for _, day in restored])
+        log_activity('批量恢复任务', f"从回收站恢复了 {len(restored)} 个任务: {[task_id for task_id, _ in restored]}")
+    return jsonify({'success': True, 'restored': [task_id for task_id, _ in restored]})
+
+@main_bp.route('/api/trash/purge', methods=['POST'])
+@login_required
+@admin_required
+def api_trash_purge():
+    task_ids, error = get_bulk_task_ids()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    purged = purge_tasks(task_ids)
+    db.session.commit()
+    if purged:
+        # 已删除的任务不在周视图中，这里只需让缓存和增量客户端感知
+        notify_schedule_change('deleted', [task_id for task_id, _ in purged], [day for _, day in purged])
+        log_activity('彻底删除任务', f"从回收站彻底删除了 {len(purged)} 个任务: {[task_id for task_id, _ in purged]}")
+    return jsonify({'success': True, 'purged': [task_id for task_id, _ in purged]})
+
+def send_workbook(path, filename):
+    response = Response(stream_file(path), mimetype=XLSX_MIMETYPE)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    response.headers["Content-Length"] = str(os.path.getsize(path))
+    # 在响应关闭时删除临时文件：HEAD 请求或客户端提前断开时生成器不会执行到底
+    response.call_on_close(functools.partial(remove_file, path))
+    return response
+
 @main_bp.route('/export_excel', methods=['POST'])
+@read_only
 @login_required
 def export_excel():
     start_date_str = request.form.get('start_date')
@@ -301,80 +636,333 @@ def export_excel():
     start_of_week = week_dates[0]
     end_of_week = week_dates[-1]
 
-    tasks = WorkSchedule.query.filter(
-        WorkSchedule.is_deleted == False,
-        WorkSchedule.task_date.between(start_of_week, end_of_week)
-    ).order_by(WorkSchedule.task_date, WorkSchedule.position).all()
-    
-    if not tasks:
+    path, _ = build_schedule_workbook(start_of_week, end_of_week, sheet_title='周工作计划')
+    if path is None:
         flash('该周没有可导出的数据。', 'warning')
         return redirect(url_for('main.index', start_date=start_date_str))
 
-    schedule_by_day = {day: [] for day in week_dates}
-    for task in tasks:
-        if task.task_date in schedule_by_day:
-            personnel_str = ", ".join([a.personnel_name for a in task.assignments])
-            schedule_by_day[task.task_date].append(task.content)
-            schedule_by_day[task.task_date].append(personnel_str)
+    log_activity('导出Excel', f"导出了 {start_of_week} 到 {end_of_week} 的工作计划。")
+    return send_workbook(path, f"work_schedule_{start_of_week}.xlsx")
 
-    max_rows = max(len(day_tasks) for day_tasks in schedule_by_day.values()) if any(schedule_by_day.values()) else 0
-    if max_rows == 0:
-        flash('该周没有可导出的数据。', 'warning')
-        return redirect(url_for('main.index', start_date=start_date_str))
+def parse_export_range(start_date_str, end_date_str):
+    """解析导出日期范围，返回 (开始日期, 结束日期, 错误信息)。"""
+    try:
+        start_date = datetime.strptime(start_date_str or '', '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str or '', '%Y-%m-%d').date()
+    except ValueError:
+        return None, None, '日期格式不正确。'
 
-    data_dict = {}
-    for day in week_dates:
-        day_str = day.strftime('%Y-%m-%d') + " (星期" + ['一','二','三','四','五','六','日'][day.weekday()] + ")"
-        tasks_for_day = schedule_by_day[day]
-        data_dict[day_str] = tasks_for_day + [''] * (max_rows - len(tasks_for_day))
+    max_days = current_app.config.get('EXPORT_MAX_DAYS', 1100)
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return None, None, f'导出范围必须在 1 到 {max_days} 天之间。'
+    return start_date, end_date, None
 
-    df = pd.DataFrame(data_dict)
+@main_bp.route('/export_excel_range', methods=['POST'])
+@read_only
+@login_required
+def export_excel_range():
+    start_date_str = request.form.get('start_date')
+    start_date, end_date, error = parse_export_range(start_date_str, request.form.get('end_date'))
+    if error:
+        flash(error, 'danger')
+        return redirect(url_for('main.index', start_date=start_date_str))
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='周工作计划')
-        worksheet = writer.sheets['周工作计划']
-        
-        header_font = Font(bold=True)
-        content_font = Font(bold=True)
-        thin_side = Side(style='thin', color="000000")
-        full_border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
-        alignment = Alignment(wrap_text=True, vertical='top')
-        band_fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")
-
-        for col_idx, col in enumerate(df.columns, 1):
-            column_letter = get_column_letter(col_idx)
-            worksheet.column_dimensions[column_letter].width = 40
-            
-            header_cell = worksheet[f"{column_letter}1"]
-            header_cell.font = header_font
-            header_cell.border = full_border
-            
-            for row_idx in range(2, max_rows + 2):
-                cell = worksheet[f"{column_letter}{row_idx}"]
-                cell.alignment = alignment
-                cell.border = full_border
-                
-                task_pair_index = (row_idx - 2) // 2
-                if (row_idx - 2) % 2 == 0:
-                    cell.font = content_font
-                    if task_pair_index % 2 == 1:
-                        cell.fill = band_fill
-                else:
-                    if task_pair_index % 2 == 1:
-                        cell.fill = band_fill
-    
-    output.seek(0)
-    log_activity('导出Excel', f"导出了 {start_of_week} 到 {end_of_week} 的工作计划。")
-    response = make_response(output.read())
-    response.headers["Content-Disposition"] = f"attachment; filename=work_schedule_{start_of_week}.xlsx"
-    response.headers["Content-type"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    personnel_names = parse_personnel_filter(request.form.getlist('personnel'))
+    path, weeks = build_schedule_workbook(start_date, end_date, personnel_names)
+    if path is None:
+        flash('所选范围内没有可导出的数据。', 'warning')
+        return redirect(url_for('main.index', start_date=start_date_str))
+
+    log_activity('导出Excel', f"导出了 {start_date} 到 {end_date} 的工作计划（{weeks} 周）。")
+    return send_workbook(path, f"work_schedule_{start_date}_{end_date}.xlsx")
+
+def parse_personnel_filter(values):
+    """把人员筛选参数（可重复，也可用逗号分隔）整理为去重排序后的姓名列表。"""
+    names = set()
+    for value in values:
+        if isinstance(value, str):
+            names.update(name.strip() for name in value.replace('，', ',').split(',') if name.strip())
+    return sorted(names)
+
+# 流式导出的格式：格式名 -> (编码函数, MIME 类型)
+RECORD_STREAM_FORMATS = {
+    'csv': (iter_schedule_csv, EXPORT_FORMATS['csv'][2]),
+    'jsonl': (iter_schedule_jsonl, EXPORT_FORMATS['jsonl'][2]),
+}
+
+@main_bp.route('/export/schedule.<export_format>')
+@read_only
+@login_required
+def export_records(export_format):
+    if export_format not in RECORD_STREAM_FORMATS:
+        abort(404)
+    start_date, end_date, error = parse_export_range(request.args.get('start_date'), request.args.get('end_date'))
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    personnel_names = parse_personnel_filter(request.args.getlist('personnel'))
+
+    encoder, mimetype = RECORD_STREAM_FORMATS[export_format]
+    log_activity('导出数据', f"以 {export_format} 格式导出了 {start_date} 到 {end_date} 的工作计划。")
+    # 边查询边输出，内存占用与导出范围无关
+    body = encoder(iter_schedule_records(start_date, end_date, personnel_names))
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename=work_schedule_{start_date}_{end_date}.{export_format}"
     return response
 
+def calendar_serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='calendar-feed')
+
+@main_bp.route('/api/calendar_feed_url')
+@login_required
+def api_calendar_feed_url():
+    name = (request.args.get('personnel') or '').strip()
+    if not Personnel.query.filter_by(name=name).first():
+        return jsonify({'success': False, 'error': f'人员 "{name}" 不存在。'}), 404
+    token = calendar_serializer().dumps({'personnel': name})
+    return jsonify({'success': True, 'personnel': name,
+                    'url': url_for('main.calendar_feed', token=token, _external=True)})
+
+@main_bp.route('/calendar/<token>.ics')
+@read_only
+def calendar_feed(token):
+    """人员日历订阅，凭签名令牌访问，日历客户端可用 ETag / If-Modified-Since 轮询。"""
+    try:
+        name = calendar_serializer().loads(token)['personnel']
+    except (BadSignature, KeyError, TypeError):
+        abort(404)
+    if not Personnel.query.filter_by(name=name).first():
+        abort(404)
+
+    today = date.today()
+    start_date = today - timedelta(days=current_app.config.get('CALENDAR_FEED_PAST_DAYS', 30))
+    end_date = today + timedelta(days=current_app.config.get('CALENDAR_FEED_FUTURE_DAYS', 180))
+    count, last_updated = schedule_data_version(start_date, end_date, [name])
+
+    # 生成器只有在需要返回内容时才会被迭代，304 响应不会查询任务
+    body = iter_schedule_ics(name, start_date, end_date, f'{name} 的工作计划', request.host.split(':')[0])
+    response = Response(stream_with_context(body), mimetype=ICS_MIMETYPE)
+    version = f"{name}:{start_date}:{count}:{last_updated.isoformat() if last_updated else ''}"
+    response.set_etag(hashlib.sha1(version.encode('utf-8')).hexdigest())
+    if last_updated:
+        response.last_modified = last_updated
+    response.cache_control.private = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+def serialize_export_job(job):
+    data = {
+        'job_id': job.id,
+        'status': job.status,
+        'format': job.format,
+        'start_date': job.start_date.isoformat(),
+        'end_date': job.end_date.isoformat(),
+        'status_url': url_for('main.api_export_job', job_id=job.id),
+    }
+    if job.status == 'done':
+        data['download_url'] = url_for('main.download_export', job_id=job.id)
+    if job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+@main_bp.route('/api/exports', methods=['POST'])
+@login_required
+def api_create_export():
+    data = request.get_json(silent=True) or {}
+    start_date, end_date, error = parse_export_range(data.get('start_date'), data.get('end_date'))
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    export_format = data.get('format') or 'xlsx'
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f'不支持的导出格式: {export_format}'}), 400
+
+    personnel = data.get('personnel') or []
+    personnel_names = parse_personnel_filter([personnel] if isinstance(personnel, str) else personnel)
+
+    job, reused = export_jobs.create(current_user.id, start_date, end_date, personnel_names, export_format)
+    if not reused:
+        log_activity('后台导出', f"提交了 {start_date} 到 {end_date} 的 {export_format} 导出任务 {job.id}。")
+    return jsonify({'success': True, 'reused': reused, **serialize_export_job(job)}), 200 if reused else 202
+
+@main_bp.route('/api/exports/<job_id>')
+@login_required
+def api_export_job(job_id):
+    job = export_jobs.expire_if_stale(db.get_or_404(ExportJob, job_id))
+    return jsonify({'success': True, **serialize_export_job(job)})
+
+@main_bp.route('/exports/<job_id>/download')
+@login_required
+def download_export(job_id):
+    job = db.get_or_404(ExportJob, job_id)
+    path = export_jobs.file_path(job)
+    if job.status != 'done' or not path or not os.path.exists(path):
+        abort(404)
+    _, extension, mimetype = EXPORT_FORMATS[job.format]
+    log_activity('下载导出', f"下载了 {job.start_date} 到 {job.end_date} 的导出文件 {job.id}。")
+    return send_file(path, mimetype=mimetype, as_attachment=True, conditional=True,
+                     download_name=f"work_schedule_{job.start_date}_{job.end_date}.{extension}")
+
+def parse_workload_args(args):
+    """解析工作量统计的查询参数，返回 (参数字典, 错误信息)。默认统计本月。"""
+    today = date.today()
+    month_start = today.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    try:
+        start_date = datetime.strptime(args.get('start_date') or month_start.isoformat(), '%Y-%m-%d').date()
+        end_date = datetime.strptime(args.get('end_date') or month_end.isoformat(), '%Y-%m-%d').date()
+    except ValueError:
+        return None, '日期格式不正确。'
+
+    max_days = current_app.config.get('ANALYTICS_MAX_DAYS', 400)
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return None, f'统计范围必须在 1 到 {max_days} 天之间。'
+
+    default_bucket = BUCKET_WEEK if (end_date - start_date).days > 62 else BUCKET_DAY
+    bucket = args.get('bucket') or default_bucket
+    if bucket not in (BUCKET_DAY, BUCKET_WEEK):
+        return None, f'不支持的分组方式: {bucket}'
+
+    threshold = args.get('threshold', type=int)
+    if threshold is None:
+        threshold = current_app.config.get('WORKLOAD_OVERLOAD_THRESHOLD', 2)
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'bucket': bucket,
+        'overload_threshold': max(threshold, 0),
+        'personnel_names': parse_personnel_filter(args.getlist('personnel')),
+    }, None
+
+@main_bp.route('/api/analytics/workload')
+@read_only
+@login_required
+def api_workload():
+    params, error = parse_workload_args(request.args)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    return jsonify({'success': True, **build_workload_report(**params)})
+
+@main_bp.route('/workload')
+@read_only
+@login_required
+def workload():
+    params, error = parse_workload_args(request.args)
+    report = None
+    if error:
+        flash(error, 'danger')
+    else:
+        report = build_workload_report(**params)
+    return render_template('main/workload.html', title='工作量统计', report=report,
+                           params=params, personnel_filter=', '.join(request.args.getlist('personnel')))
+
+def run_search(args):
+    """解析检索参数并查询一页结果，返回 (检索词, 筛选条件, 分页结果, 错误信息)。"""
+    terms = parse_terms(args.get('q'))
+    filters = {
+        'q': args.get('q', ''),
+        'date_from': args.get('date_from', ''),
+        'date_to': args.get('date_to', ''),
+        'personnel': args.get('personnel', ''),
+    }
+    if not terms:
+        return terms, filters, None, None
+    try:
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d').date() if filters['date_from'] else None
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d').date() if filters['date_to'] else None
+    except ValueError:
+        return terms, filters, None, '日期格式不正确。'
+
+    query = search_query(terms, date_from, date_to, parse_personnel_filter([filters['personnel']]))
+    page = keyset_paginate(query, [WorkSchedule.task_date, WorkSchedule.id],
+                           after=args.get('after'), before=args.get('before'),
+                           per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
+    return terms, filters, page, None
+
+@main_bp.route('/search')
+@read_only
+@login_required
+def search():
+    terms, filters, page, error = run_search(request.args)
+    if error:
+        flash(error, 'danger')
+    results = [{
+        'task': task,
+        'snippet': highlight(html_to_text(task.content), terms),
+        'personnel': [a.personnel_name for a in task.assignments],
+    } for task in (page.items if page else [])]
+    active_filters = {key: value for key, value in filters.items() if value}
+    return render_template('main/search.html', title='搜索', results=results, page=page,
+                           filters=filters, active_filters=active_filters)
+
+@main_bp.route('/api/search')
+@read_only
+@login_required
+def api_search():
+    terms, filters, page, error = run_search(request.args)
+    if error or not terms:
+        return jsonify({'success': False, 'error': error or '请输入检索词。'}), 400
+    return jsonify({
+        'success': True,
+        'items': [{
+            'id': task.id,
+            'task_date': task.task_date.isoformat(),
+            'content': task.content,
+            'snippet': str(highlight(html_to_text(task.content), terms)),
+            'personnel': [a.personnel_name for a in task.assignments],
+            'week_url': url_for('main.index', start_date=task.task_date.isoformat()),
+        } for task in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
 @main_bp.route('/logs')
+@read_only
 @login_required
 @admin_required
 def activity_logs():
-    page = request.args.get('page', 1, type=int)
-    logs = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).paginate(page=page, per_page=20)
-    return render_template('main/logs.html', logs=logs, title="操作日志")
\ No newline at end of file
+    # 先写入本进程缓冲中的日志，保证刚刚发生的操作能立即看到
+    activity_log_writer.flush()
+
+    filters = {
+        'user_id': request.args.get('user_id', type=int),
+        'action': request.args.get('action', '').strip(),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+        'include_archived': request.args.get('include_archived', type=int),
+    }
+    try:
+        date_from = datetime.strptime(filters['date_from'], '%Y-%m-%d') if filters['date_from'] else None
+        date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1) if filters['date_to'] else None
+    except ValueError:
+        flash('日期格式不正确。', 'danger')
+        return redirect(url_for('main.activity_logs'))
+
+    # 勾选“包含归档”时透明地合并按月归档表
+    source = activity_log_source(bool(filters['include_archived']), date_from, date_to)
+    query = db.session.query(
+        source.c.id, source.c.timestamp, source.c.action, source.c.details, User.username
+    ).outerjoin(User, User.id == source.c.user_id)
+    if filters['user_id']:
+        query = query.filter(source.c.user_id == filters['user_id'])
+    if filters['action']:
+        query = query.filter(source.c.action == filters['action'])
+    if date_from:
+        query = query.filter(source.c.timestamp >= date_from)
+    if date_to:
+        query = query.filter(source.c.timestamp < date_to)
+
+    total, total_is_exact = approximate_count(query)
+    logs = keyset_paginate(
+        query,
+        [source.c.timestamp, source.c.id],
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=20
+    )
+    users = User.query.order_by(User.username).all()
+    active_filters = {k: v for k, v in filters.items() if v}
+    return render_template('main/logs.html', logs=logs, title="操作日志", users=users,
+                           filters=filters, active_filters=active_filters,
+                           total=total, total_is_exact=total_is_exact)
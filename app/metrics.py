@@ -0,0 +1,219 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 请求耗时直方图的桶上限（秒）
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每次请求 SQL 条数直方图的桶上限
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# 慢请求日志中最多列出的语句数及每条语句保留的长度
+SLOW_LOG_STATEMENTS = 10
+STATEMENT_MAX_LENGTH = 500
+# 单个请求最多记录的语句数，防止批量循环撑大内存
+MAX_TRACKED_STATEMENTS = 200
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class RequestMetrics:
+    """
+    请求级性能统计：按端点记录耗时直方图、SQL 条数和数据库耗时（通过 SQLAlchemy 引擎事件），
+    记录慢请求和慢查询日志，可按比例对请求做 cProfile 采样。统计数据保存在进程内，
+    每个 gunicorn worker 各自独立。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._listening = False
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.latency_buckets = tuple(app.config.get('METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS))
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', 1000)
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', 200)
+        self.profile_sample_rate = app.config.get('METRICS_PROFILE_SAMPLE_RATE', 0)
+        self.profile_dir = app.config.get('METRICS_PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        app.extensions['request_metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if not self._listening:
+            # 监听所有引擎，之后加入的只读副本引擎也会被统计
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+    def reset(self):
+        with self._lock:
+            self._latency = {}
+            self._query_counts = {}
+            self._requests = {}
+            self._db_statements = {}
+            self._db_seconds = {}
+            self._slow_requests = {}
+            self._slow_queries = {}
+
+    # --- 请求钩子 ---
+
+    def _before_request(self):
+        g._metrics = {'started': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0,
+                      'statements': [], 'status': 500, 'profiler': None}
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 已有其他分析器在运行（如 Python 3.12 的全局 sys.monitoring），跳过本次采样
+                return
+            g._metrics['profiler'] = profiler
+
+    def _after_request(self, response):
+        state = g.get('_metrics')
+        if state is not None:
+            state['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        state = g.pop('_metrics', None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state['started']
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'static':
+            return
+        method = request.method
+        if state['profiler'] is not None:
+            state['profiler'].disable()
+            self._dump_profile(state['profiler'], endpoint)
+
+        key = (endpoint, method)
+        with self._lock:
+            self._latency.setdefault(key, Histogram(self.latency_buckets)).observe(elapsed)
+            self._query_counts.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(state['queries'])
+            status_key = (endpoint, method, str(state['status']))
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            self._db_statements[key] = self._db_statements.get(key, 0) + state['queries']
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + state['db_seconds']
+            if elapsed * 1000 >= self.slow_request_ms:
+                self._slow_requests[key] = self._slow_requests.get(key, 0) + 1
+
+        if elapsed * 1000 >= self.slow_request_ms:
+            slowest = sorted(state['statements'], key=lambda item: item[0], reverse=True)[:SLOW_LOG_STATEMENTS]
+            details = ''.join(f'\n  {seconds * 1000:.1f} ms  {statement}' for seconds, statement in slowest)
+            current_app.logger.warning(
+                '慢请求 %s %s (%s) 耗时 %.1f ms，%d 条 SQL 共 %.1f ms%s',
+                method, request.full_path.rstrip('?'), endpoint, elapsed * 1000,
+                state['queries'], state['db_seconds'] * 1000, details
+            )
+
+    def _dump_profile(self, profiler, endpoint):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.prof')
+            profiler.dump_stats(path)
+        except OSError:
+            current_app.logger.exception('写入性能采样文件失败')
+
+    # --- 引擎事件 ---
+
+    @staticmethod
+    def _current_state():
+        # 只统计请求线程中的语句；后台导出、日志写入线程没有请求上下文
+        if not has_request_context():
+            return None
+        return g.get('_metrics')
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state = self._current_state()
+        if state is not None:
+            conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state = self._current_state()
+        started = conn.info.get('_metrics_started')
+        if state is None or not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        state['queries'] += 1
+        state['db_seconds'] += seconds
+        statement = ' '.join(statement.split())[:STATEMENT_MAX_LENGTH]
+        if len(state['statements']) < MAX_TRACKED_STATEMENTS:
+            state['statements'].append((seconds, statement))
+        if seconds * 1000 >= self.slow_query_ms:
+            endpoint = request.endpoint or 'unmatched'
+            with self._lock:
+                self._slow_queries[endpoint] = self._slow_queries.get(endpoint, 0) + 1
+            current_app.logger.warning('慢查询 (%s) 耗时 %.1f ms: %s', endpoint, seconds * 1000, statement)
+
+    # --- 输出 ---
+
+    def _histogram_lines(self, name, help_text, histograms, label_names):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for key, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(label_names + ("le",), key + (bound,))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, key)} {histogram.total}')
+            lines.append(f'{name}_count{_labels(label_names, key)} {histogram.count}')
+        return lines
+
+    @staticmethod
+    def _counter_lines(name, help_text, values, label_names):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f'{name}{_labels(label_names, key)} {value}')
+        return lines
+
+    def render_prometheus(self):
+        """以 Prometheus 文本格式输出当前进程的统计数据。"""
+        endpoint_method = ('endpoint', 'method')
+        with self._lock:
+            lines = self._histogram_lines('http_request_duration_seconds', '请求耗时（秒）',
+                                          self._latency, endpoint_method)
+            lines += self._histogram_lines('http_request_db_statements', '每次请求执行的 SQL 条数',
+                                           self._query_counts, endpoint_method)
+            lines += self._counter_lines('http_requests_total', '请求数', self._requests,
+                                         ('endpoint', 'method', 'status'))
+            lines += self._counter_lines('db_statements_total', 'SQL 语句总数', self._db_statements, endpoint_method)
+            lines += self._counter_lines('db_time_seconds_total', 'SQL 总耗时（秒）', self._db_seconds, endpoint_method)
+            lines += self._counter_lines('slow_requests_total', f'耗时超过 {self.slow_request_ms} ms 的请求数',
+                                         self._slow_requests, endpoint_method)
+            lines += self._counter_lines('slow_queries_total', f'耗时超过 {self.slow_query_ms} ms 的 SQL 数',
+                                         self._slow_queries, ('endpoint',))
+        return '\n'.join(lines) + '\n'
@@ -1,10 +1,30 @@
 from datetime import datetime
 from flask_login import UserMixin
-from . import db, login_manager, bcrypt # 导入 bcrypt
+from . import db, login_manager, bcrypt, user_cache # 导入 bcrypt
+
+class UserSnapshot(UserMixin):
+    """
+    load_user 返回的只读用户信息（用户名和权限），来自 user_cache，不绑定数据库会话。
+    需要修改用户时用 db.session.get(User, current_user.id) 取得实体。
+    """
+    def __init__(self, id, username, is_admin, can_add, can_edit, can_delete):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+        self.can_add = can_add
+        self.can_edit = can_edit
+        self.can_delete = can_delete
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    data = user_cache.get(user_id)
+    if data is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        data = user_cache.set(user)
+    return UserSnapshot(**data)
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,7 +36,8 @@ class User(db.Model, UserMixin):
     can_edit = db.Column(db.Boolean, nullable=False, default=False)
     can_delete = db.Column(db.Boolean, nullable=False, default=False)
     
-    schedules = db.relationship('WorkSchedule', back_populates='author', lazy=True)
+    schedules = db.relationship('WorkSchedule', back_populates='author', lazy=True,
+                                foreign_keys='WorkSchedule.author_id')
     logs = db.relationship('ActivityLog', back_populates='user', lazy=True)
     sent_invitations = db.relationship('InvitationCode', back_populates='creator', lazy=True)
 
@@ -33,20 +54,48 @@ class InvitationCode(db.Model):
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     creator = db.relationship('User', back_populates='sent_invitations')
 
+class TaskContent(db.Model):
+    # 清洗后的任务内容按 sha256 去重存放，同一次创建的多日任务共享一行
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class WorkSchedule(db.Model):
+    # 周视图、批量创建时取最大 position 等热点查询都只针对未删除的任务，
+    # 用部分索引覆盖 (task_date, position)，同时满足范围过滤和排序
+    __table_args__ = (
+        db.Index('ix_work_schedule_live_date_position', 'task_date', 'position',
+                 postgresql_where=db.text('is_deleted = false'),
+                 sqlite_where=db.text('is_deleted = 0')),
+        # 回收站按删除时间倒序分页，定期清理按删除时间取最早的一批
+        db.Index('ix_work_schedule_trash_deleted_at_id', 'deleted_at', 'id',
+                 postgresql_where=db.text('is_deleted = true'),
+                 sqlite_where=db.text('is_deleted = 1')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     task_date = db.Column(db.Date, nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('task_content.id'), nullable=True, index=True)
+    # 旧版本直接存放在任务表中的内容，由 'flask content backfill' 迁移到 task_content 后置空
+    legacy_content = db.Column('content', db.Text, nullable=True)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     position = db.Column(db.Integer, nullable=False, default=0)
     version = db.Column(db.Integer, nullable=False, default=0)
+    # 同一次 add_task 创建的多日任务共享同一个系列标识，用于快速还原日期区间
+    series_id = db.Column(db.String(32), nullable=True, index=True)
     
-    is_deleted = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    is_deleted = db.Column(db.Boolean, nullable=False, default=False)
     deleted_at = db.Column(db.DateTime, nullable=True)
+    deleted_by_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    # 检索用纯文本（内容去掉 HTML + 人员姓名），只在检索时读取
+    search_text = db.deferred(db.Column(db.Text, nullable=True))
 
-    author = db.relationship('User', back_populates='schedules')
+    author = db.relationship('User', back_populates='schedules', foreign_keys=[author_id])
+    deleted_by = db.relationship('User', foreign_keys=[deleted_by_id])
+    content_ref = db.relationship('TaskContent', lazy='joined')
     assignments = db.relationship(
         'TaskAssignment', 
         backref='task', 
@@ -55,7 +104,26 @@ class WorkSchedule(db.Model):
         order_by='TaskAssignment.position'
     )
 
+    @property
+    def content(self):
+        if self.content_ref is not None:
+            return self.content_ref.html
+        return self.legacy_content
+
+    @content.setter
+    def content(self, html):
+        from .content import intern_content
+        self.content_ref = intern_content(html)
+        self.legacy_content = None
+
 class ActivityLog(db.Model):
+    # 日志页按 (timestamp, id) 做游标分页，按用户、操作筛选时同样走复合索引
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_activity_log_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_activity_log_action_timestamp_id', 'action', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     action = db.Column(db.String(100), nullable=False)
@@ -71,9 +139,31 @@ class Personnel(db.Model):
 
 class TaskAssignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    task_id = db.Column(db.Integer, db.ForeignKey('work_schedule.id'), nullable=False)
-    personnel_name = db.Column(db.String(100), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('work_schedule.id'), nullable=False, index=True)
+    # 人员删除后置空；姓名不在人员表中（历史数据）时也为空
+    personnel_id = db.Column(db.Integer, db.ForeignKey('personnel.id', ondelete='SET NULL'),
+                             nullable=True, index=True)
+    personnel_name = db.Column(db.String(100), nullable=False)  # 冗余保存姓名，用于显示
     position = db.Column(db.Integer, nullable=False)
 
+    personnel = db.relationship('Personnel')
+
     def __repr__(self):
-        return f'<TaskAssignment {self.personnel_name}>'
\ No newline at end of file
+        return f'<TaskAssignment {self.personnel_name}>'
+
+class ExportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    personnel_filter = db.Column(db.Text, nullable=True)  # JSON 数组，空表示全部人员
+    format = db.Column(db.String(10), nullable=False, default='xlsx')
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/done/failed/empty
+    # 由导出参数和数据版本戳计算，参数相同且数据未变化时复用已生成的文件
+    cache_key = db.Column(db.String(64), nullable=False, index=True)
+    file_name = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User')
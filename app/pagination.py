@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import func, select, tuple_
+from . import db
+
+# 非 PostgreSQL 数据库上精确计数的上限，超过后只显示“N+”
+COUNT_CAP = 10000
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """按排序列的类型还原游标中的值，游标无效时返回 None。"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(raw_values) != len(columns):
+            return None
+        values = []
+        for raw, column in zip(raw_values, columns):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                values.append(datetime.fromisoformat(raw))
+            elif python_type is date:
+                values.append(date.fromisoformat(raw))
+            else:
+                values.append(python_type(raw))
+        return values
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, columns, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self._columns = columns
+
+    def _cursor_of(self, item):
+        return encode_cursor([getattr(item, column.key) for column in self._columns])
+
+    @property
+    def next_cursor(self):
+        return self._cursor_of(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        return self._cursor_of(self.items[0]) if self.has_prev and self.items else None
+
+
+def keyset_paginate(query, columns, after=None, before=None, per_page=20):
+    """
+    按 columns 降序做游标分页，不使用 OFFSET，也不统计总数。
+    after 取游标之后（更旧）的一页，before 取游标之前（更新）的一页。
+    columns 需要能唯一确定顺序，通常以主键结尾，并应有对应的复合索引。
+    """
+    key = tuple_(*columns)
+    before_values = decode_cursor(before, columns) if before else None
+    after_values = decode_cursor(after, columns) if after else None
+
+    if before_values is not None:
+        rows = query.filter(key > tuple_(*before_values)) \
+            .order_by(*[c.asc() for c in columns]).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, columns, has_next=True, has_prev=has_prev)
+
+    if after_values is not None:
+        query = query.filter(key < tuple_(*after_values))
+    rows = query.order_by(*[c.desc() for c in columns]).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], columns,
+                      has_next=len(rows) > per_page, has_prev=after_values is not None)
+
+
+def approximate_count(query):
+    """
+    返回 (数量, 是否精确)。PostgreSQL 上读取查询计划的估计行数，不扫描数据；
+    其他数据库上精确计数，但最多数到 COUNT_CAP。
+    """
+    statement = query.statement
+    if db.engine.dialect.name == 'postgresql':
+        compiled = statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            f'EXPLAIN (FORMAT JSON) {compiled.string}', compiled.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    capped = statement.order_by(None).limit(COUNT_CAP + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(capped)).scalar()
+    return min(count, COUNT_CAP), count <= COUNT_CAP
@@ -0,0 +1,177 @@
+import json
+import re
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, select
+from . import db
+from .models import WorkSchedule, TaskAssignment, ActivityLog, Personnel, User
+
+# 出现顺序扫描即视为退化的表；personnel、user 等小表不检查
+HOT_TABLES = {'work_schedule', 'task_assignment', 'activity_log'}
+# SQLAlchemy 为关联加载生成的别名，如 task_assignment_1
+ALIAS_SUFFIX = re.compile(r'_\d+$')
+
+# 样例数据：以今天为中心的天数、每天的任务数、人员数和操作日志条数
+SAMPLE_DAYS = 120
+SAMPLE_TASKS_PER_DAY = 4
+SAMPLE_PERSONNEL = 10
+SAMPLE_LOGS = 500
+
+
+def hot_queries():
+    """返回 [(名称, SQLAlchemy 语句)]，与各页面和接口实际执行的查询保持一致。"""
+    from .schedule import (live_tasks_query, max_positions_query, day_counts_query, changes_query,
+                           _query_same_content)
+    from .trash import trash_query
+
+    today = date.today()
+    week = [today + timedelta(days=i) for i in range(7)]
+    sample_task = WorkSchedule(task_date=today, content_id=1)
+
+    return [
+        ('周视图任务（含人员）', live_tasks_query(week[0], week[-1]).statement),
+        ('批量创建取最大 position', max_positions_query(week).statement),
+        ('月视图每日任务数', day_counts_query(week[0], week[0] + timedelta(days=41)).statement),
+        ('日期区间还原（历史任务）', _query_same_content(sample_task).filter(
+            WorkSchedule.series_id.is_(None),
+            WorkSchedule.task_date.between(today - timedelta(days=62), today + timedelta(days=62))
+        ).statement),
+        ('日期区间还原（系列任务）', _query_same_content(sample_task).filter(
+            WorkSchedule.series_id == 'series'
+        ).statement),
+        ('增量变更', changes_query(datetime.utcnow(), week[0], week[-1], [1, 2, 3]).statement),
+        ('任务的人员分配', select(TaskAssignment).where(TaskAssignment.task_id.in_([1, 2, 3]))),
+        ('人员的任务分配', select(TaskAssignment).where(TaskAssignment.personnel_id == 1)),
+        ('回收站首页', trash_query().order_by(WorkSchedule.deleted_at.desc(), WorkSchedule.id.desc())
+            .limit(51).statement),
+        ('操作日志首页', select(ActivityLog)
+            .order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(21)),
+    ]
+
+
+def _compile(statement):
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        return compiled.string, tuple(compiled.params[name] for name in compiled.positiontup)
+    return compiled.string, compiled.params
+
+
+def explain(statement):
+    """
+    返回 (计划文本行, 顺序扫描的表集合)。PostgreSQL 上关闭 enable_seqscan 后读取 JSON 计划，
+    这样即使本地表很小，只要存在可用索引就不会选择顺序扫描；SQLite 使用 EXPLAIN QUERY PLAN，
+    查询时临时建的自动索引（AUTOMATIC INDEX）说明缺少索引，同样算作退化。
+    """
+    sql, params = _compile(statement)
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}', params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scanned = [], set()
+
+        def walk(node, depth):
+            relation = node.get('Relation Name')
+            index = node.get('Index Name')
+            lines.append('  ' * depth + node['Node Type']
+                         + (f' on {relation}' if relation else '')
+                         + (f' using {index}' if index else ''))
+            if node['Node Type'] == 'Seq Scan' and relation:
+                scanned.add(relation)
+            for child in node.get('Plans', []):
+                walk(child, depth + 1)
+
+        walk(plan[0]['Plan'], 0)
+        return lines, scanned
+
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params).all()
+    lines = [row[-1] for row in rows]
+    scanned = set()
+    for line in lines:
+        # "SCAN t" 是全表扫描；"SCAN t USING INDEX ..." 按索引顺序读取，不算退化
+        words = line.split()
+        if len(words) < 2 or words[0] not in ('SCAN', 'SEARCH'):
+            continue
+        if (words[0] == 'SCAN' and 'USING' not in words) or 'AUTOMATIC' in words:
+            scanned.add(ALIAS_SUFFIX.sub('', words[1]))
+    return lines, scanned
+
+
+def check_query_plans():
+    """逐个 EXPLAIN 热点查询，返回 [(名称, 计划文本行, 退化为顺序扫描的热点表)]。"""
+    results = []
+    try:
+        for name, statement in hot_queries():
+            lines, scanned = explain(statement)
+            results.append((name, lines, sorted(scanned & HOT_TABLES)))
+    finally:
+        db.session.rollback()
+    return results
+
+
+def report_query_plans(echo, verbose=False):
+    """检查热点查询并逐条输出结果，全部使用索引时返回 True。"""
+    passed = True
+    for name, lines, scanned in check_query_plans():
+        if scanned:
+            passed = False
+            echo(f'[失败] {name}: 未使用索引 {", ".join(scanned)}')
+        else:
+            echo(f'[通过] {name}')
+        if verbose or scanned:
+            for line in lines:
+                echo(f'        {line}')
+    return passed
+
+
+def seed_sample_data(days=SAMPLE_DAYS, tasks_per_day=SAMPLE_TASKS_PER_DAY):
+    """
+    在空数据库中写入一小份样例数据：一个无法登录的用户、若干人员、以今天为中心的任务
+    （含系列任务和回收站中的任务）及其人员分配、操作日志，供 EXPLAIN 使用。
+    """
+    from .content import intern_contents
+    from .schedule import POSITION_GAP
+
+    user_id = db.session.scalar(insert(User).values(username='query-plan-sample', password_hash='!')
+                                .returning(User.id))
+    names = [f'样例人员{i}' for i in range(SAMPLE_PERSONNEL)]
+    db.session.execute(insert(Personnel), [{'name': name} for name in names])
+    personnel_ids = dict(db.session.query(Personnel.name, Personnel.id).all())
+    contents = [f'<p>样例任务 {i}</p>' for i in range(20)]
+    content_ids = intern_contents(contents)
+
+    now = datetime.utcnow()
+    first_day = date.today() - timedelta(days=days // 2)
+    task_rows, task_personnel = [], []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        for index in range(tasks_per_day):
+            number = offset * tasks_per_day + index
+            deleted = number % 10 == 0
+            task_rows.append({
+                'task_date': day,
+                'content_id': content_ids[contents[number % len(contents)]],
+                'author_id': user_id,
+                'position': index * POSITION_GAP,
+                'series_id': uuid.uuid4().hex if number % 7 == 0 else None,
+                'is_deleted': deleted,
+                'deleted_at': now if deleted else None,
+                'created_at': now,
+                'updated_at': now - timedelta(minutes=number % 600),
+            })
+            task_personnel.append([names[number % len(names)], names[(number + 3) % len(names)]])
+    task_ids = list(db.session.scalars(
+        insert(WorkSchedule).returning(WorkSchedule.id, sort_by_parameter_order=True), task_rows
+    ))
+    db.session.execute(insert(TaskAssignment), [
+        {'task_id': task_id, 'personnel_id': personnel_ids[name], 'personnel_name': name, 'position': index}
+        for task_id, assigned in zip(task_ids, task_personnel)
+        for index, name in enumerate(assigned)
+    ])
+    db.session.execute(insert(ActivityLog), [
+        {'user_id': user_id, 'action': '样例', 'details': f'样例日志 #{i}', 'timestamp': now - timedelta(hours=i)}
+        for i in range(SAMPLE_LOGS)
+    ])
+    db.session.commit()
+    return len(task_ids)
@@ -0,0 +1,511 @@
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import Date, case, or_, func, insert, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from . import db, schedule_cache, schedule_events
+from .cache import week_start
+from .models import WorkSchedule, TaskAssignment, Personnel
+from .search import build_search_text
+from .content import intern_contents
+
+# 没有 series_id 的历史任务按日期窗口批量查询，窗口触及边界时再向外扩展
+RANGE_WINDOW_DAYS = 62
+
+# 增量查询时把水位线往前放宽的秒数，避免遗漏提交较晚但时间戳较早的事务
+CHANGES_CLOCK_SKEW = timedelta(seconds=5)
+# 单次增量查询返回的最大行数，超过时让客户端整周重新加载
+CHANGES_LIMIT = 500
+
+# 单次批量创建允许的最大天数，防止误填日期生成海量任务
+MAX_RANGE_DAYS = 731
+
+# 同一天相邻任务 position 的默认间隔。拖动排序时取前后两个任务的中间值，
+# 只需要改被移动的一行；间隔用完时再把当天的任务重新按间隔排开
+POSITION_GAP = 1024
+
+RECURRENCE_DAILY = 'daily'
+RECURRENCE_WEEKDAYS = 'weekdays'
+RECURRENCE_EVERY_N_DAYS = 'every_n_days'
+
+
+class date_add(FunctionElement):
+    """日期加上整数天数。各数据库的日期运算写法不同，由下面的 compiles 分别生成。"""
+    type = Date()
+    name = 'date_add'
+    inherit_cache = True
+
+
+@compiles(date_add)
+def _compile_date_add(element, compiler, **kw):
+    day, days = list(element.clauses)
+    return f'({compiler.process(day, **kw)} + {compiler.process(days, **kw)})'
+
+
+@compiles(date_add, 'sqlite')
+def _compile_date_add_sqlite(element, compiler, **kw):
+    day, days = list(element.clauses)
+    return f"date({compiler.process(day, **kw)}, {compiler.process(days, **kw)} || ' days')"
+
+
+def _personnel_key(task):
+    return frozenset(a.personnel_name for a in task.assignments)
+
+
+def live_tasks_query(start_date, end_date):
+    """日期范围内未删除的任务，按日期和 position 排序，走 (task_date, position) 部分索引。"""
+    return WorkSchedule.query.filter(
+        WorkSchedule.is_deleted == False,
+        WorkSchedule.task_date.between(start_date, end_date)
+    ).order_by(WorkSchedule.task_date, WorkSchedule.position)
+
+
+def max_positions_query(dates):
+    """各日期未删除任务的最大 position。"""
+    return db.session.query(WorkSchedule.task_date, func.max(WorkSchedule.position)) \
+        .filter(WorkSchedule.task_date.in_(dates), WorkSchedule.is_deleted == False) \
+        .group_by(WorkSchedule.task_date)
+
+
+def day_counts_query(start_date, end_date):
+    """日期范围内每天未删除的任务数，只读 (task_date, position) 部分索引。"""
+    return db.session.query(WorkSchedule.task_date, func.count(WorkSchedule.id)) \
+        .filter(WorkSchedule.is_deleted == False, WorkSchedule.task_date.between(start_date, end_date)) \
+        .group_by(WorkSchedule.task_date)
+
+
+def changes_query(since, start_date=None, end_date=None, task_ids=()):
+    """
+    since 之后修改过的任务。指定日期范围时只返回落在范围内的任务，
+    以及 task_ids 中（客户端正在显示、可能已被移出范围）的任务。
+    """
+    query = WorkSchedule.query.filter(WorkSchedule.updated_at >= since - CHANGES_CLOCK_SKEW)
+    if start_date is not None:
+        in_range = WorkSchedule.task_date.between(start_date, end_date)
+        query = query.filter(or_(in_range, WorkSchedule.id.in_(task_ids)) if task_ids else in_range)
+    return query.order_by(WorkSchedule.updated_at).limit(CHANGES_LIMIT + 1)
+
+
+def _query_same_content(task):
+    # 内容已去重存放，比较内容 id 即可；尚未迁移的历史任务仍比较旧列中的全文
+    same_content = WorkSchedule.content_id == task.content_id if task.content_id is not None \
+        else WorkSchedule.legacy_content == task.legacy_content
+    return WorkSchedule.query.filter(WorkSchedule.is_deleted == False, same_content)
+
+
+def _series_range(task_date, dates):
+    """
+    从 task_date 出发向前后逐个检查系列中的下一个日期，遇到缺失（被删除或被拖走）就停止。
+    重复间隔取相邻日期的最小间隔；间隔为一天且全部落在工作日时视为按工作日重复，跳过周末。
+    """
+    ordered = sorted(dates)
+    gaps = [b - a for a, b in zip(ordered, ordered[1:])]
+    step = min(gaps) if gaps else timedelta(days=1)
+    skip_weekends = step == timedelta(days=1) and all(d.weekday() < 5 for d in ordered)
+
+    def next_date(day, direction):
+        day += step * direction
+        while skip_weekends and day.weekday() >= 5:
+            day += timedelta(days=direction)
+        return day
+
+    start_date = end_date = task_date
+    while next_date(start_date, -1) in dates:
+        start_date = next_date(start_date, -1)
+    while next_date(end_date, 1) in dates:
+        end_date = next_date(end_date, 1)
+    return start_date, end_date
+
+
+def resolve_task_range(task):
+    """
+    找出与 task 内容和人员完全相同的连续任务区间，返回 (start_date, end_date)。
+    有 series_id 的任务用一次索引查询取出系列中的日期，再按重复间隔向前后合并；
+    历史任务则在有界日期窗口内批量取出候选行，在内存中向前后合并连续日期。
+    """
+    personnel_key = _personnel_key(task)
+
+    if task.series_id:
+        members = _query_same_content(task).filter(
+            WorkSchedule.series_id == task.series_id
+        ).all()
+        dates = {m.task_date for m in members if _personnel_key(m) == personnel_key}
+        dates.add(task.task_date)
+        return _series_range(task.task_date, dates)
+
+    def fetch_matching_dates(*ranges):
+        candidates = _query_same_content(task).filter(
+            WorkSchedule.series_id.is_(None),
+            or_(*[WorkSchedule.task_date.between(lo, hi) for lo, hi in ranges])
+        ).all()
+        return {c.task_date for c in candidates if _personnel_key(c) == personnel_key}
+
+    one_day = timedelta(days=1)
+    window = timedelta(days=RANGE_WINDOW_DAYS)
+    window_start, window_end = task.task_date - window, task.task_date + window
+    matching_dates = fetch_matching_dates((window_start, window_end))
+    start_date = end_date = task.task_date
+
+    while True:
+        while start_date - one_day in matching_dates:
+            start_date -= one_day
+        while end_date + one_day in matching_dates:
+            end_date += one_day
+
+        # 区间触及窗口边界时，只对需要的方向再取下一段窗口
+        ranges = []
+        if start_date - one_day < window_start:
+            ranges.append((window_start - window, window_start - one_day))
+            window_start -= window
+        if end_date + one_day > window_end:
+            ranges.append((window_end + one_day, window_end + window))
+            window_end += window
+        if not ranges:
+            return start_date, end_date
+        matching_dates |= fetch_matching_dates(*ranges)
+
+
+def expand_recurrence(start_date, end_date, recurrence=RECURRENCE_DAILY, interval_days=1):
+    """
+    按重复规则展开 [start_date, end_date] 内需要创建任务的日期。
+    规则不合法时抛出 ValueError。
+    """
+    if end_date < start_date:
+        raise ValueError('结束日期不能早于开始日期。')
+    if (end_date - start_date).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'日期范围不能超过 {MAX_RANGE_DAYS} 天。')
+
+    if recurrence == RECURRENCE_EVERY_N_DAYS:
+        if interval_days < 1:
+            raise ValueError('重复间隔必须为正整数。')
+        step = timedelta(days=interval_days)
+    elif recurrence in (RECURRENCE_DAILY, RECURRENCE_WEEKDAYS):
+        step = timedelta(days=1)
+    else:
+        raise ValueError('未知的重复规则。')
+
+    dates = []
+    current_date = start_date
+    while current_date <= end_date:
+        if recurrence != RECURRENCE_WEEKDAYS or current_date.weekday() < 5:
+            dates.append(current_date)
+        current_date += step
+    return dates
+
+
+def resolve_personnel_ids(names):
+    """一次查询把姓名解析为人员 id，返回 {姓名: id}，不在人员表中的姓名不出现在结果中。"""
+    if not names:
+        return {}
+    return dict(db.session.query(Personnel.name, Personnel.id).filter(Personnel.name.in_(set(names))).all())
+
+
+def link_personnel_assignments(person):
+    """把姓名相同但尚未关联人员的分配记录关联到 person，返回更新的行数。"""
+    return db.session.execute(
+        update(TaskAssignment)
+        .where(TaskAssignment.personnel_name == person.name, TaskAssignment.personnel_id.is_(None))
+        .values(personnel_id=person.id)
+    ).rowcount
+
+
+def backfill_personnel_ids(batch_size=5000):
+    """
+    为 personnel_id 为空的分配记录按姓名补齐人员 id。按主键分批更新，每批单独提交；
+    姓名不在人员表中的记录保持为空。返回 (检查的行数, 关联上的行数)。
+    """
+    person_id = select(Personnel.id).where(Personnel.name == TaskAssignment.personnel_name) \
+        .scalar_subquery()
+    last_id, scanned, linked = 0, 0, 0
+    while True:
+        ids = db.session.scalars(
+            select(TaskAssignment.id)
+            .where(TaskAssignment.personnel_id.is_(None), TaskAssignment.id > last_id)
+            .order_by(TaskAssignment.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        result = db.session.execute(
+            update(TaskAssignment)
+            .where(TaskAssignment.id.in_(ids), person_id.isnot(None))
+            .values(personnel_id=person_id)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        scanned += len(ids)
+        linked += result.rowcount
+        last_id = ids[-1]
+    return scanned, linked
+
+
+def bulk_create_tasks(dates, content, personnel_names, author_id, series_id=None):
+    """
+    为每个日期批量创建同一任务：一次分组查询取得各日最大 position，
+    再分别用一条批量 INSERT 写入 WorkSchedule 和 TaskAssignment。
+    返回新任务的 id 列表（与 dates 顺序一致），不负责提交事务。
+    """
+    if not dates:
+        return []
+
+    max_positions = dict(max_positions_query(dates).all())
+
+    def next_position(day):
+        max_pos = max_positions.get(day)
+        return 0 if max_pos is None else max_pos + POSITION_GAP
+
+    now = datetime.utcnow()
+    content_id = intern_contents([content])[content]
+    search_text = build_search_text(content, personnel_names)
+    task_rows = [{
+        'task_date': day,
+        'content_id': content_id,
+        'search_text': search_text,
+        'author_id': author_id,
+        'position': next_position(day),
+        'series_id': series_id,
+        'created_at': now,
+        'updated_at': now,
+    } for day in dates]
+    task_ids = list(db.session.scalars(
+        insert(WorkSchedule).returning(WorkSchedule.id, sort_by_parameter_order=True),
+        task_rows
+    ))
+
+    personnel_ids = resolve_personnel_ids(personnel_names)
+    assignment_rows = [
+        {'task_id': task_id, 'personnel_id': personnel_ids.get(name), 'personnel_name': name, 'position': index}
+        for task_id in task_ids
+        for index, name in enumerate(personnel_names)
+    ]
+    if assignment_rows:
+        db.session.execute(insert(TaskAssignment), assignment_rows)
+    return task_ids
+
+
+def _check_range(start_date, end_date, offset_days):
+    if end_date < start_date:
+        raise ValueError('结束日期不能早于开始日期。')
+    if (end_date - start_date).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'日期范围不能超过 {MAX_RANGE_DAYS} 天。')
+    if offset_days == 0:
+        raise ValueError('目标日期不能与原日期相同。')
+    if abs(offset_days) > MAX_RANGE_DAYS:
+        raise ValueError(f'平移天数不能超过 {MAX_RANGE_DAYS} 天。')
+
+
+def copy_tasks(start_date, end_date, offset_days, author_id):
+    """
+    把 [start_date, end_date] 内未删除的任务连同人员分配复制到 offset_days 天之后（或之前）。
+    复制出的任务排在目标日期已有任务之后并保持原有先后顺序；同一系列的任务复制后共享新的系列标识。
+    返回 (新任务 id 列表, 目标日期列表)，不负责提交事务。参数不合法时抛出 ValueError。
+    """
+    _check_range(start_date, end_date, offset_days)
+    sources = live_tasks_query(start_date, end_date).all()
+    if not sources:
+        return [], []
+
+    shift = timedelta(days=offset_days)
+    target_dates = sorted({task.task_date + shift for task in sources})
+    max_positions = dict(max_positions_query(target_dates).all())
+    series_ids = {task.series_id: uuid.uuid4().hex for task in sources if task.series_id}
+    min_positions = {}
+    for task in sources:
+        min_positions.setdefault(task.task_date, task.position)
+    # 复制出的任务直接引用原任务的内容 id，只有尚未迁移的历史任务需要写入内容表
+    legacy_ids = intern_contents([task.legacy_content for task in sources if task.content_id is None])
+
+    now = datetime.utcnow()
+    task_rows = []
+    for task in sources:
+        target_date = task.task_date + shift
+        max_pos = max_positions.get(target_date)
+        base = -min_positions[task.task_date] if max_pos is None \
+            else max_pos + POSITION_GAP - min_positions[task.task_date]
+        task_rows.append({
+            'task_date': target_date,
+            'content_id': task.content_id if task.content_id is not None else legacy_ids[task.legacy_content],
+            'search_text': build_search_text(task.content, [a.personnel_name for a in task.assignments]),
+            'author_id': author_id,
+            'position': base + task.position,
+            'series_id': series_ids.get(task.series_id),
+            'created_at': now,
+            'updated_at': now,
+        })
+    task_ids = list(db.session.scalars(
+        insert(WorkSchedule).returning(WorkSchedule.id, sort_by_parameter_order=True),
+        task_rows
+    ))
+
+    assignment_rows = [
+        {'task_id': task_id, 'personnel_id': a.personnel_id, 'personnel_name': a.personnel_name,
+         'position': a.position}
+        for task_id, task in zip(task_ids, sources)
+        for a in task.assignments
+    ]
+    if assignment_rows:
+        db.session.execute(insert(TaskAssignment), assignment_rows)
+    return task_ids, target_dates
+
+
+def shift_tasks(start_date, end_date, offset_days):
+    """
+    用一条 UPDATE 把 [start_date, end_date] 内未删除的任务整体平移 offset_days 天，人员分配随任务 id 不变。
+    平移后的任务排在目标日期原有任务之后，原有先后顺序不变。
+    返回 [(id, 原日期, 新日期)]，不负责提交事务。参数不合法时抛出 ValueError。
+    """
+    _check_range(start_date, end_date, offset_days)
+    shift = timedelta(days=offset_days)
+
+    # 目标日期中不参与平移的任务的最大 position，按平移前的日期换算成每一天的偏移量
+    stationary = db.session.query(WorkSchedule.task_date, func.max(WorkSchedule.position)).filter(
+        WorkSchedule.is_deleted == False,
+        WorkSchedule.task_date.between(start_date + shift, end_date + shift),
+        ~WorkSchedule.task_date.between(start_date, end_date)
+    ).group_by(WorkSchedule.task_date).all()
+    offsets = {}
+    if stationary:
+        min_positions = dict(db.session.query(WorkSchedule.task_date, func.min(WorkSchedule.position)).filter(
+            WorkSchedule.is_deleted == False,
+            WorkSchedule.task_date.in_([day - shift for day, _ in stationary])
+        ).group_by(WorkSchedule.task_date).all())
+        offsets = {day - shift: max_pos + POSITION_GAP - min_positions[day - shift]
+                   for day, max_pos in stationary if day - shift in min_positions}
+    position = WorkSchedule.position
+    if offsets:
+        position = position + case(offsets, value=WorkSchedule.task_date, else_=0)
+
+    moved = db.session.execute(
+        update(WorkSchedule)
+        .where(WorkSchedule.is_deleted == False, WorkSchedule.task_date.between(start_date, end_date))
+        .values(task_date=date_add(WorkSchedule.task_date, offset_days), position=position,
+                version=WorkSchedule.version + 1, updated_at=datetime.utcnow())
+        .returning(WorkSchedule.id, WorkSchedule.task_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return [(task_id, new_date - shift, new_date) for task_id, new_date in moved]
+
+
+def day_task_versions(day, exclude_id=None):
+    """某天未删除任务的 [(id, version, position)]，按显示顺序排列。"""
+    query = db.session.query(WorkSchedule.id, WorkSchedule.version, WorkSchedule.position).filter(
+        WorkSchedule.is_deleted == False, WorkSchedule.task_date == day
+    )
+    if exclude_id is not None:
+        query = query.filter(WorkSchedule.id != exclude_id)
+    return query.order_by(WorkSchedule.position, WorkSchedule.id).all()
+
+
+def position_between(before, after):
+    """前后两个任务之间可用的 position；没有空隙时返回 None。"""
+    if before is None and after is None:
+        return 0
+    if before is None:
+        return after - POSITION_GAP
+    if after is None:
+        return before + POSITION_GAP
+    if after - before >= 2:
+        return (before + after) // 2
+    return None
+
+
+def move_task(task, new_date, ordered_ids):
+    """
+    把 task 移到 new_date，ordered_ids 为移动后当天任务的完整顺序（含 task）。
+    通常只更新被移动的一行；前后任务之间没有空隙时，用一条 CASE UPDATE 把当天任务重新按间隔排开。
+    只有被移动的任务版本号加一。返回 (新 position, 新版本号)，不负责提交事务。
+    """
+    index = ordered_ids.index(task.id)
+    positions = dict((task_id, position) for task_id, _, position in day_task_versions(new_date, task.id))
+    before = positions[ordered_ids[index - 1]] if index > 0 else None
+    after = positions[ordered_ids[index + 1]] if index + 1 < len(ordered_ids) else None
+    now = datetime.utcnow()
+
+    position = position_between(before, after)
+    if position is not None:
+        db.session.execute(
+            update(WorkSchedule).where(WorkSchedule.id == task.id)
+            .values(task_date=new_date, position=position, version=WorkSchedule.version + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        position = (index + 1) * POSITION_GAP
+        # 位置变化的任务也刷新 updated_at，让其他客户端通过增量接口取到新顺序
+        db.session.execute(
+            update(WorkSchedule).where(WorkSchedule.id.in_(ordered_ids))
+            .values(
+                task_date=new_date,
+                position=case({task_id: (i + 1) * POSITION_GAP for i, task_id in enumerate(ordered_ids)},
+                              value=WorkSchedule.id),
+                version=WorkSchedule.version + case((WorkSchedule.id == task.id, 1), else_=0),
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return position, task.version + 1
+
+
+def serialize_task(task):
+    return {
+        'id': task.id,
+        'task_date': task.task_date.strftime('%Y-%m-%d'),
+        'content': task.content,
+        'personnel': [a.personnel_name for a in task.assignments],
+        'position': task.position,
+        'version': task.version,
+        'is_deleted': task.is_deleted,
+    }
+
+
+def build_week_payload(week_dates):
+    """查询一周内的任务并按日期分组，返回可直接缓存（JSON 可序列化）的字典。"""
+    # 水位线取查询之前的时间，之后的修改都能被增量接口取到
+    watermark = datetime.utcnow()
+    tasks = live_tasks_query(week_dates[0], week_dates[-1]).all()
+
+    days = {day.strftime('%Y-%m-%d'): [] for day in week_dates}
+    for task in tasks:
+        day_key = task.task_date.strftime('%Y-%m-%d')
+        if day_key in days:
+            days[day_key].append(serialize_task(task))
+
+    # 判断周末是否有任务，用于前端提示
+    weekend_has_tasks = any(days[day.strftime('%Y-%m-%d')] for day in week_dates[5:])
+    return {
+        'week_start': week_dates[0].strftime('%Y-%m-%d'),
+        'days': days,
+        'weekend_has_tasks': weekend_has_tasks,
+        'watermark': watermark.isoformat(),
+    }
+
+
+def fetch_changes_since(since, week_dates=None, task_ids=()):
+    """
+    返回 since 之后修改过的任务（包括已删除和移出本周的任务），以及新的水位线。
+    指定 week_dates 时只返回这一周的任务和 task_ids 中的任务，其他周的大量修改不会影响本周。
+    变更过多时返回 (None, watermark)，由调用方提示客户端整体刷新。
+    """
+    watermark = datetime.utcnow()
+    if week_dates:
+        tasks = changes_query(since, week_dates[0], week_dates[-1], task_ids).all()
+    else:
+        tasks = changes_query(since).all()
+    if len(tasks) > CHANGES_LIMIT:
+        return None, watermark
+    return [serialize_task(task) for task in tasks], watermark
+
+
+def notify_schedule_change(kind, task_ids, dates):
+    """
+    在事务提交后调用：使受影响周的缓存失效，并向这些周的订阅者推送变更事件。
+    kind 取值 created / updated / moved / deleted / restored。
+    """
+    dates = {day for day in dates if day is not None}
+    schedule_cache.invalidate_dates(dates)
+    event = {
+        'type': kind,
+        'task_ids': list(task_ids),
+        'dates': sorted(day.strftime('%Y-%m-%d') for day in dates),
+    }
+    for start_of_week in {week_start(day) for day in dates}:
+        schedule_events.publish(start_of_week, event)
@@ -0,0 +1,179 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import inspect, select, text, update
+from . import db
+from .exports import html_to_text
+from .content import content_html
+from .models import WorkSchedule, TaskAssignment, TaskContent
+
+# 由 'flask search setup' 创建、不属于模型的对象，迁移脚本需要忽略
+SEARCH_INDEX_NAME = 'ix_work_schedule_search_trgm'
+FTS_TABLE = 'work_schedule_fts'
+
+# FTS5 trigram 分词器和 pg_trgm 都以三个字符为单位建索引，更短的词只能逐行匹配
+MIN_INDEXED_TERM_LENGTH = 3
+MAX_TERMS = 8
+SNIPPET_RADIUS = 40
+
+_backend_cache = {}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """供 Flask-Migrate 使用：忽略全文检索的索引和 FTS5 虚拟表。"""
+    if type_ == 'index' and name == SEARCH_INDEX_NAME:
+        return False
+    return not (type_ == 'table' and name.startswith(FTS_TABLE))
+
+
+def build_search_text(content, personnel_names):
+    """检索用的纯文本：去掉 HTML 的任务内容加上人员姓名。"""
+    return html_to_text(content) + '\n' + ' '.join(personnel_names)
+
+
+def refresh_search_text(task):
+    """在修改任务内容或人员之后、提交之前调用。"""
+    task.search_text = build_search_text(task.content, [a.personnel_name for a in task.assignments])
+
+
+def search_backend(refresh=False):
+    """
+    返回当前数据库可用的检索方式：'fts5'（SQLite 且已创建 FTS 表）、
+    'trigram'（PostgreSQL，pg_trgm 索引）或 'like'（未执行 setup 时逐行匹配）。
+    """
+    key = str(db.engine.url)
+    if refresh or key not in _backend_cache:
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            _backend_cache[key] = 'fts5' if inspect(db.engine).has_table(FTS_TABLE) else 'like'
+        elif dialect == 'postgresql':
+            _backend_cache[key] = 'trigram'
+        else:
+            _backend_cache[key] = 'like'
+    return _backend_cache[key]
+
+
+def setup_search_index():
+    """创建检索所需的数据库对象（可重复执行）。"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX_NAME} '
+            'ON work_schedule USING gin (search_text gin_trgm_ops)'
+        ))
+    elif dialect == 'sqlite':
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "search_text, content='work_schedule', content_rowid='id', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON work_schedule BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON work_schedule BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON work_schedule BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+            f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+        ]
+        for statement in statements:
+            db.session.execute(text(statement))
+    db.session.commit()
+    search_backend(refresh=True)
+
+
+def rebuild_search_text(batch_size=1000, only_missing=True):
+    """按主键分批重新计算 search_text，每批单独提交，返回更新的行数。"""
+    last_id, updated = 0, 0
+    while True:
+        query = select(WorkSchedule.id, content_html.label('content')) \
+            .outerjoin(TaskContent, WorkSchedule.content_id == TaskContent.id) \
+            .where(WorkSchedule.id > last_id)
+        if only_missing:
+            query = query.where(WorkSchedule.search_text.is_(None))
+        rows = db.session.execute(query.order_by(WorkSchedule.id).limit(batch_size)).all()
+        if not rows:
+            break
+        task_ids = [row.id for row in rows]
+        personnel = {}
+        for task_id, name in db.session.execute(
+            select(TaskAssignment.task_id, TaskAssignment.personnel_name)
+            .where(TaskAssignment.task_id.in_(task_ids))
+            .order_by(TaskAssignment.task_id, TaskAssignment.position)
+        ):
+            personnel.setdefault(task_id, []).append(name)
+        db.session.execute(
+            update(WorkSchedule).execution_options(synchronize_session=False),
+            [{'id': row.id, 'search_text': build_search_text(row.content, personnel.get(row.id, []))}
+             for row in rows]
+        )
+        db.session.commit()
+        updated += len(rows)
+        last_id = task_ids[-1]
+
+    if search_backend(refresh=True) == 'fts5':
+        # 外部内容表在建表前已有的数据需要整体重建一次索引
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        db.session.commit()
+    return updated
+
+
+def parse_terms(q):
+    """按空白拆分检索词，去重并限制数量。"""
+    terms = []
+    for term in (q or '').split():
+        if term.lower() not in [t.lower() for t in terms]:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_query(terms, date_from=None, date_to=None, personnel_names=None):
+    """所有检索词都需要命中（AND），只返回未删除的任务。"""
+    query = WorkSchedule.query.filter(WorkSchedule.is_deleted == False)
+    backend = search_backend()
+
+    like_terms = terms
+    if backend == 'fts5':
+        indexed = [t for t in terms if len(t) >= MIN_INDEXED_TERM_LENGTH]
+        like_terms = [t for t in terms if len(t) < MIN_INDEXED_TERM_LENGTH]
+        if indexed:
+            match = ' '.join('"' + t.replace('"', '""') + '"' for t in indexed)
+            query = query.filter(WorkSchedule.id.in_(
+                select(text('rowid')).select_from(text(FTS_TABLE))
+                .where(text(f'{FTS_TABLE} MATCH :match').bindparams(match=match))
+            ))
+    for term in like_terms:
+        query = query.filter(WorkSchedule.search_text.ilike(f'%{_escape_like(term)}%', escape='\\'))
+
+    if date_from:
+        query = query.filter(WorkSchedule.task_date >= date_from)
+    if date_to:
+        query = query.filter(WorkSchedule.task_date <= date_to)
+    if personnel_names:
+        query = query.filter(WorkSchedule.id.in_(
+            select(TaskAssignment.task_id).where(TaskAssignment.personnel_name.in_(personnel_names))
+        ))
+    return query
+
+
+def highlight(text_value, terms, radius=SNIPPET_RADIUS):
+    """截取第一个命中位置附近的片段，命中的词用 <mark> 标出，其余内容全部转义。"""
+    if not text_value:
+        return Markup('')
+    pattern = re.compile('|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE) \
+        if terms else None
+    first = pattern.search(text_value) if pattern else None
+    start = max(first.start() - radius, 0) if first else 0
+    end = min((first.end() if first else 0) + radius * 2, len(text_value))
+    snippet = text_value[start:end]
+
+    parts, position = [], 0
+    for match in (pattern.finditer(snippet) if pattern else ()):
+        parts.append(escape(snippet[position:match.start()]))
+        parts.append(Markup('<mark>') + escape(match.group()) + Markup('</mark>'))
+        position = match.end()
+    parts.append(escape(snippet[position:]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text_value) else ''
+    return Markup(prefix) + Markup('').join(parts) + Markup(suffix)
@@ -35,6 +35,12 @@ document.addEventListener('DOMContentLoaded', function () {
     const formContent = document.getElementById('taskFormContent');
     const formStartDate = document.getElementById('taskFormStartDate');
     const formEndDate = document.getElementById('taskFormEndDate');
+    const formRecurrenceRow = document.getElementById('taskFormRecurrenceRow');
+    const formRecurrence = document.getElementById('taskFormRecurrence');
+    const formIntervalCol = document.getElementById('taskFormIntervalCol');
+
+    const cardTemplate = document.getElementById('task-card-template');
+    let scheduleWatermark = typeof SCHEDULE_WATERMARK !== 'undefined' ? SCHEDULE_WATERMARK : null;
 
     const personnelDisplayArea = document.getElementById('personnelDisplayArea');
     const hiddenPersonnelInput = document.getElementById('taskFormPersonnel');
@@ -174,16 +180,22 @@ document.addEventListener('DOMContentLoaded', function () {
                 ghostClass: 'blue-background-class',
                 onEnd: async function (evt) {
                     const movedTaskElement = evt.item;
+                    // 只提交移出和移入的两天，服务器据此检查冲突
+                    const listTasks = container => Array.from(container.querySelectorAll('.task-card'))
+                        .map(c => ({ id: parseInt(c.dataset.taskId), version: parseInt(c.dataset.taskVersion) }));
                     const payload = {
                         moved_task: {
                             id: parseInt(movedTaskElement.dataset.taskId),
                             version: parseInt(movedTaskElement.dataset.taskVersion)
                         },
+                        source_list: {
+                            date: evt.from.dataset.date,
+                            tasks: listTasks(evt.from)
+                        },
                         target_list: {
                             date: evt.to.dataset.date,
-                            task_ids: Array.from(evt.to.querySelectorAll('.task-card')).map(card => card.dataset.taskId)
-                        },
-                        all_tasks_in_view: Array.from(document.querySelectorAll('.task-card')).map(c => ({ id: parseInt(c.dataset.taskId), version: parseInt(c.dataset.taskVersion) }))
+                            tasks: listTasks(evt.to)
+                        }
                     };
                     try {
                         const response = await fetch('/api/reorder_tasks', {
@@ -193,10 +205,10 @@ document.addEventListener('DOMContentLoaded', function () {
                         });
                         if (!response.ok) {
                             const errorData = await response.json();
-                            showToast(errorData.error || "操作失败，页面将刷新以同步最新状态。", 'danger');
-                            setTimeout(() => location.reload(), 2000);
+                            showToast(errorData.error || "操作失败，已同步最新状态。", 'danger');
+                            await reloadWeek();
                         } else {
-                             location.reload();
+                            await refreshSchedule();
                         }
                     } catch (error) {
                         showToast("网络错误，操作失败。页面将刷新。", 'danger');
@@ -228,7 +240,130 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
     
+    function buildTaskCard(task) {
+        const card = cardTemplate.content.firstElementChild.cloneNode(true);
+        card.querySelectorAll('[data-task-id]').forEach(el => { el.dataset.taskId = task.id; });
+        card.dataset.taskId = task.id;
+        card.dataset.taskVersion = task.version;
+        card.dataset.taskPosition = task.position;
+        card.querySelector('.task-content').innerHTML = task.content;
+        const tags = card.querySelector('.personnel-tags');
+        tags.innerHTML = '';
+        task.personnel.forEach(name => {
+            const tag = document.createElement('span');
+            tag.className = 'personnel-tag';
+            tag.title = name;
+            tag.textContent = name;
+            tags.appendChild(tag);
+        });
+        return card;
+    }
+
+    function placeTaskCard(container, card) {
+        const position = parseInt(card.dataset.taskPosition);
+        const taskId = parseInt(card.dataset.taskId);
+        const next = Array.from(container.querySelectorAll('.task-card')).find(c => {
+            const p = parseInt(c.dataset.taskPosition);
+            return p > position || (p === position && parseInt(c.dataset.taskId) > taskId);
+        });
+        container.insertBefore(card, next || container.querySelector('.empty-day-placeholder'));
+        checkAndToggleEmptyPlaceholder(container);
+    }
+
+    // 用服务器返回的任务数据更新页面：先移除旧卡片，再按日期和位置插入新卡片
+    function applyTaskChange(task) {
+        const existing = document.querySelector(`.task-card[data-task-id="${task.id}"]`);
+        if (existing) {
+            const oldContainer = existing.parentElement;
+            existing.remove();
+            checkAndToggleEmptyPlaceholder(oldContainer);
+        }
+        if (task.is_deleted) return;
+        const container = document.querySelector(`.task-list-container[data-date="${task.task_date}"]`);
+        if (container) placeTaskCard(container, buildTaskCard(task));
+    }
+
+    async function reloadWeek() {
+        try {
+            const response = await fetch(`/api/schedule?start_date=${WEEK_START}`, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            document.querySelectorAll('.task-list-container').forEach(container => {
+                container.querySelectorAll('.task-card').forEach(card => card.remove());
+                (data.days[container.dataset.date] || []).forEach(task => placeTaskCard(container, buildTaskCard(task)));
+                checkAndToggleEmptyPlaceholder(container);
+            });
+            scheduleWatermark = data.watermark;
+            updateWeekendBadge();
+        } catch (error) {
+            location.reload();
+        }
+    }
+
+    // 只拉取水位线之后变化的任务并局部更新，替代整页刷新
+    async function refreshSchedule() {
+        if (!scheduleWatermark) {
+            location.reload();
+            return;
+        }
+        try {
+            // 带上本周和页面上的任务 id，服务端只返回与本周有关的变更（包括被移出本周的任务）
+            const taskIds = Array.from(document.querySelectorAll('.task-card[data-task-id]'), card => card.dataset.taskId);
+            const params = new URLSearchParams({ since: scheduleWatermark, start_date: WEEK_START, ids: taskIds.join(',') });
+            const response = await fetch(`/api/schedule/changes?${params}`, { headers: { 'Accept': 'application/json' } });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            if (data.reset) {
+                await reloadWeek();
+                return;
+            }
+            data.changes.forEach(applyTaskChange);
+            scheduleWatermark = data.watermark;
+            updateWeekendBadge();
+        } catch (error) {
+            location.reload();
+        }
+    }
+
+    // 订阅本周的实时变更推送；多个事件合并为一次增量刷新
+    let refreshTimer = null;
+    function scheduleRefresh() {
+        if (refreshTimer) return;
+        refreshTimer = setTimeout(() => {
+            refreshTimer = null;
+            refreshSchedule();
+        }, 300);
+    }
+
+    if (typeof WEEK_START !== 'undefined' && typeof EventSource !== 'undefined') {
+        const eventSource = new EventSource(`/api/schedule/stream?start_date=${WEEK_START}`);
+        ['created', 'updated', 'moved', 'deleted', 'restored'].forEach(type => {
+            eventSource.addEventListener(type, scheduleRefresh);
+        });
+        let connectedOnce = false;
+        eventSource.addEventListener('open', () => {
+            // 断线重连期间可能错过事件，重连后补一次增量刷新
+            if (connectedOnce) scheduleRefresh();
+            connectedOnce = true;
+        });
+    }
+
     const weekendToggleBtn = document.getElementById('weekend-toggle-btn');
+
+    function updateWeekendBadge() {
+        if (!weekendToggleBtn) return;
+        const hasTasks = document.querySelector('.weekend-column .task-card') !== null;
+        let badge = weekendToggleBtn.querySelector('.badge');
+        if (hasTasks && !badge) {
+            badge = document.createElement('span');
+            badge.className = 'badge rounded-pill bg-primary ms-1';
+            badge.style.cssText = 'width: 8px; height: 8px; padding: 0;';
+            weekendToggleBtn.appendChild(badge);
+        } else if (!hasTasks && badge) {
+            badge.remove();
+        }
+    }
+
     if(weekendToggleBtn){
         weekendToggleBtn.addEventListener('click', () => {
             const weekendCols = document.querySelectorAll('.weekend-column');
@@ -261,6 +396,8 @@ document.addEventListener('DOMContentLoaded', function () {
             formEndDate.value = date;
             formEndDate.min = date;
             formEndDate.parentElement.parentElement.style.display = 'flex';
+            formRecurrenceRow.style.display = 'flex';
+            formIntervalCol.style.display = 'none';
         }
 
         if (editBtn) {
@@ -282,6 +419,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     formEndDate.value = task.end_date;
                     formVersion.value = task.version;
                     formEndDate.parentElement.parentElement.style.display = 'flex';
+                    formRecurrenceRow.style.display = 'none';
                 } else { showToast('无法加载任务详情。', 'danger'); taskModal.hide(); }
             } catch (error) { showToast('网络错误，无法加载任务详情。', 'danger'); }
         }
@@ -300,7 +438,10 @@ document.addEventListener('DOMContentLoaded', function () {
                     method: 'POST',
                     headers: { 'X-CSRFToken': csrfToken }
                 });
-                if (response.ok) { location.reload(); } 
+                if (response.ok) {
+                    showToast('任务已恢复。', 'success');
+                    await refreshSchedule();
+                } 
                 else { showToast('恢复失败。', 'danger'); }
             } catch (error) {
                 showToast('网络错误，恢复失败。', 'danger');
@@ -322,6 +463,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 const container = card.parentElement;
                 card.remove();
                 checkAndToggleEmptyPlaceholder(container);
+                updateWeekendBadge();
             } else {
                 showToast(data.error || '删除失败。', 'danger');
             }
@@ -342,7 +484,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 response = await fetch("/add_task", {
                     method: 'POST',
                     body: formData,
-                    headers: { 'X-CSRFToken': csrfToken }
+                    headers: { 'Accept': 'application/json', 'X-CSRFToken': csrfToken }
                 });
             } else if (action === 'edit') {
                 const taskId = formTaskId.value;
@@ -360,7 +502,8 @@ document.addEventListener('DOMContentLoaded', function () {
             }
 
             if (response.ok) {
-                location.reload();
+                taskModal.hide();
+                await refreshSchedule();
             } else if (response.status === 409) {
                 const errorData = await response.json();
                 handleConflict(errorData.current_data, {
@@ -405,7 +548,8 @@ document.addEventListener('DOMContentLoaded', function () {
             });
 
             if(response.ok) {
-                location.reload();
+                conflictModal.hide();
+                await refreshSchedule();
             } else {
                 showToast('覆盖失败，可能发生了新的冲突。请刷新页面。', 'danger');
                 conflictModal.hide();
@@ -416,6 +560,10 @@ document.addEventListener('DOMContentLoaded', function () {
         };
     }
 
+    formRecurrence.addEventListener('change', function() {
+        formIntervalCol.style.display = this.value === 'every_n_days' ? 'block' : 'none';
+    });
+
     formStartDate.addEventListener('change', function() {
         const endDateInput = document.getElementById('taskFormEndDate');
         if (!endDateInput.value || endDateInput.value < this.value) {
@@ -423,4 +571,152 @@ document.addEventListener('DOMContentLoaded', function () {
         }
         endDateInput.min = this.value;
     });
+
+    async function postRangeOperation(button, payload, confirmText) {
+        if (!confirm(confirmText)) return;
+        button.disabled = true;
+        try {
+            const response = await fetch(button.dataset.url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'application/json', 'X-CSRFToken': csrfToken },
+                body: JSON.stringify(Object.assign({
+                    start_date: document.getElementById('bulkRangeStart').value,
+                    end_date: document.getElementById('bulkRangeEnd').value
+                }, payload))
+            });
+            const data = await response.json();
+            if (!response.ok || !data.success) {
+                showToast(data.error || '操作失败。', 'danger');
+                return;
+            }
+            showToast(data.count ? `已处理 ${data.count} 个任务。` : '所选范围内没有任务。', data.count ? 'success' : 'warning');
+            if (data.count) reloadWeek();
+        } catch (error) {
+            showToast('网络错误，操作失败。', 'danger');
+        } finally {
+            button.disabled = false;
+        }
+    }
+
+    const copyRangeBtn = document.getElementById('copyRangeBtn');
+    if (copyRangeBtn) {
+        copyRangeBtn.addEventListener('click', function () {
+            const targetStart = document.getElementById('copyTargetStart').value;
+            postRangeOperation(copyRangeBtn, { target_start: targetStart },
+                `确定将所选范围内的任务复制到 ${targetStart} 开始的日期吗？`);
+        });
+    }
+
+    const shiftRangeBtn = document.getElementById('shiftRangeBtn');
+    if (shiftRangeBtn) {
+        shiftRangeBtn.addEventListener('click', function () {
+            const days = parseInt(document.getElementById('shiftDays').value, 10);
+            if (!Number.isInteger(days) || days === 0) {
+                showToast('请输入非零的平移天数。', 'warning');
+                return;
+            }
+            postRangeOperation(shiftRangeBtn, { days: days },
+                `确定将所选范围内的任务整体平移 ${days} 天吗？`);
+        });
+    }
+
+    const exportJobBtn = document.getElementById('exportJobBtn');
+    if (exportJobBtn) {
+        const exportJobStatus = document.getElementById('exportJobStatus');
+
+        async function pollExportJob(statusUrl) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                const response = await fetch(statusUrl, { headers: { 'Accept': 'application/json' } });
+                if (!response.ok) throw new Error(`status ${response.status}`);
+                const job = await response.json();
+                if (job.status !== 'pending' && job.status !== 'running') return job;
+                exportJobStatus.textContent = '正在生成…';
+            }
+        }
+
+        exportJobBtn.addEventListener('click', async function () {
+            const personnel = document.getElementById('exportRangePersonnel').value
+                .split(/[,，]/).map(name => name.trim()).filter(Boolean);
+            exportJobBtn.disabled = true;
+            exportJobStatus.textContent = '正在提交…';
+            try {
+                const response = await fetch(exportJobBtn.dataset.url, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'application/json', 'X-CSRFToken': csrfToken },
+                    body: JSON.stringify({
+                        start_date: document.getElementById('exportRangeStart').value,
+                        end_date: document.getElementById('exportRangeEnd').value,
+                        personnel: personnel,
+                        format: document.getElementById('exportRangeFormat').value
+                    })
+                });
+                let job = await response.json();
+                if (!response.ok) {
+                    exportJobStatus.textContent = '';
+                    showToast(job.error || '提交导出任务失败。', 'danger');
+                    return;
+                }
+                if (job.status === 'pending' || job.status === 'running') {
+                    exportJobStatus.textContent = '正在生成…';
+                    job = await pollExportJob(job.status_url);
+                }
+                exportJobStatus.textContent = '';
+                if (job.status === 'done') {
+                    showToast(`导出文件已生成。 <a href="${job.download_url}">点击下载</a>`, 'success', true);
+                } else if (job.status === 'empty') {
+                    showToast('所选范围内没有可导出的数据。', 'warning');
+                } else {
+                    showToast(job.error || '导出失败。', 'danger');
+                }
+            } catch (error) {
+                exportJobStatus.textContent = '';
+                showToast('网络错误，无法获取导出状态。', 'danger');
+            } finally {
+                exportJobBtn.disabled = false;
+            }
+        });
+
+        const exportRangeForm = document.getElementById('exportRangeForm');
+        exportRangeForm.addEventListener('submit', function (e) {
+            const format = document.getElementById('exportRangeFormat').value;
+            if (format === 'xlsx') return;
+            // CSV / JSON Lines 走流式下载接口
+            e.preventDefault();
+            const params = new URLSearchParams({
+                start_date: document.getElementById('exportRangeStart').value,
+                end_date: document.getElementById('exportRangeEnd').value,
+                personnel: document.getElementById('exportRangePersonnel').value
+            });
+            window.location.href = exportRangeForm.dataset.recordsUrl.replace('__format__', format) + '?' + params;
+        });
+
+        document.getElementById('calendarFeedBtn').addEventListener('click', async function () {
+            const name = document.getElementById('exportRangePersonnel').value.split(/[,，]/)[0].trim();
+            if (!name) {
+                showToast('请先在“人员”中填写一个姓名。', 'warning');
+                return;
+            }
+            try {
+                const response = await fetch(`${this.dataset.url}?personnel=${encodeURIComponent(name)}`,
+                    { headers: { 'Accept': 'application/json' } });
+                const data = await response.json();
+                if (!response.ok) {
+                    showToast(data.error || '无法生成订阅地址。', 'danger');
+                    return;
+                }
+                const input = document.createElement('input');
+                input.type = 'text';
+                input.readOnly = true;
+                input.className = 'form-control form-control-sm mt-1';
+                input.setAttribute('value', data.url);
+                const wrapper = document.createElement('div');
+                wrapper.textContent = `${data.personnel} 的日历订阅地址（可添加到日历应用）：`;
+                wrapper.appendChild(input);
+                showToast(wrapper.outerHTML, 'info', true);
+            } catch (error) {
+                showToast('网络错误，无法生成订阅地址。', 'danger');
+            }
+        });
+    }
 });
\ No newline at end of file
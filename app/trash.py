@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, select, update
+from . import db
+from .models import WorkSchedule, TaskAssignment
+
+# 单次批量恢复/彻底删除允许的最大任务数
+MAX_BULK_IDS = 1000
+
+
+def trash_query(date_from=None, date_to=None, deleted_by_id=None):
+    """回收站中的任务，可按任务日期和删除人筛选。"""
+    query = WorkSchedule.query.filter(WorkSchedule.is_deleted == True)
+    if date_from:
+        query = query.filter(WorkSchedule.task_date >= date_from)
+    if date_to:
+        query = query.filter(WorkSchedule.task_date <= date_to)
+    if deleted_by_id:
+        query = query.filter(WorkSchedule.deleted_by_id == deleted_by_id)
+    return query
+
+
+def restore_tasks(task_ids):
+    """用一条 UPDATE 恢复 task_ids 中已删除的任务，返回 [(id, 日期)]。不负责提交事务。"""
+    if not task_ids:
+        return []
+    return db.session.execute(
+        update(WorkSchedule)
+        .where(WorkSchedule.id.in_(task_ids), WorkSchedule.is_deleted == True)
+        .values(is_deleted=False, deleted_at=None, deleted_by_id=None)
+        .returning(WorkSchedule.id, WorkSchedule.task_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def purge_tasks(task_ids):
+    """
+    彻底删除 task_ids 中已在回收站的任务及其人员分配，返回 [(id, 日期)]。
+    只会删除 is_deleted 为真的任务；不负责提交事务。
+    """
+    if not task_ids:
+        return []
+    purged = db.session.execute(
+        select(WorkSchedule.id, WorkSchedule.task_date)
+        .where(WorkSchedule.id.in_(task_ids), WorkSchedule.is_deleted == True)
+    ).all()
+    if not purged:
+        return []
+    purged_ids = [task_id for task_id, _ in purged]
+    db.session.execute(
+        delete(TaskAssignment).where(TaskAssignment.task_id.in_(purged_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(WorkSchedule).where(WorkSchedule.id.in_(purged_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return purged
+
+
+def purge_expired(retention_days, batch_size=500):
+    """
+    分批彻底删除进入回收站超过 retention_days 天的任务，每批单独提交，
+    避免长事务和长时间持有行锁。返回删除的任务数。
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    purged = 0
+    while True:
+        task_ids = db.session.scalars(
+            select(WorkSchedule.id)
+            .where(WorkSchedule.is_deleted == True,
+                   or_(WorkSchedule.deleted_at < cutoff, WorkSchedule.deleted_at.is_(None)))
+            .order_by(WorkSchedule.deleted_at, WorkSchedule.id)
+            .limit(batch_size)
+        ).all()
+        if not task_ids:
+            break
+        purged += len(purge_tasks(task_ids))
+        db.session.commit()
+    return purged
@@ -1,16 +1,10 @@
 from flask_login import current_user
-from .models import ActivityLog
-from . import db
+from . import activity_log_writer
 
 def log_activity(action, details=""):
     """
-    Helper function to create and save an activity log.
+    Helper function to record an activity log.
+    Entries are written through the buffered writer configured by ACTIVITY_LOG_MODE.
     """
     if current_user.is_authenticated:
-        log = ActivityLog(
-            user_id=current_user.id,
-            action=action,
-            details=details
-        )
-        db.session.add(log)
-        db.session.commit()
+        activity_log_writer.write(current_user.id, action, details)
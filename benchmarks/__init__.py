@@ -0,0 +1,12 @@
+"""
+性能基准测试。
+
+    # 生成测试数据（默认写入 instance/benchmark.db，可用 --database-url 指向本地 PostgreSQL）
+    python -m benchmarks seed --reset --years 2 --logs 1000000
+
+    # 运行基准测试并与基线比较；--save-baseline 把本次结果写为新的基线
+    python -m benchmarks run --iterations 50 --baseline benchmarks/baseline.json
+
+基准测试通过 Flask test client 调用真实路由，统计每个场景的延迟分位数、
+每次请求的 SQL 条数和峰值内存（tracemalloc）。
+"""
@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import click
+from app import create_app, db
+from .runner import run_benchmarks, format_results, compare_results, load_json, save_json
+from .scenarios import SCENARIOS
+from .seed import seed_database
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_DATABASE = 'sqlite:///' + os.path.join(os.path.dirname(BENCHMARK_DIR), 'instance', 'benchmark.db')
+
+database_option = click.option('--database-url', default=DEFAULT_DATABASE, show_default=True,
+                               envvar='BENCHMARK_DATABASE_URL', help='基准测试使用的数据库，不要指向生产库。')
+
+
+def make_app(database_url, cache=False, replica_urls=()):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        # 不使用环境变量中配置的只读副本，只有显式传入 --replica-url 时才测量读写分离
+        'SQLALCHEMY_REPLICA_URIS': list(replica_urls),
+        'WTF_CSRF_ENABLED': False,
+        'SERVER_NAME': None,
+        # 默认关闭周视图缓存，测量的是数据库路径；--cache 时测量缓存命中后的表现
+        'SCHEDULE_CACHE_BACKEND': 'memory' if cache else 'null',
+        'SCHEDULE_EVENTS_BACKEND': 'null',
+        'EXPORT_DIR': os.path.join(tempfile.gettempdir(), 'schedule-benchmark-exports'),
+    })
+
+
+@click.group()
+def cli():
+    """周计划系统性能基准测试。"""
+
+
+@cli.command()
+@database_option
+@click.option('--reset', is_flag=True, help='先删除并重建所有表。')
+@click.option('--users', type=int, default=20, show_default=True)
+@click.option('--personnel', type=int, default=60, show_default=True)
+@click.option('--years', type=int, default=2, show_default=True, help='生成多少年的任务。')
+@click.option('--tasks-per-day', type=int, default=8, show_default=True)
+@click.option('--logs', type=int, default=200000, show_default=True, help='操作日志条数。')
+@click.option('--seed', type=int, default=42, show_default=True, help='随机数种子，相同参数生成相同数据。')
+def seed(database_url, reset, users, personnel, years, tasks_per_day, logs, seed):
+    """生成基准测试数据。"""
+    app = make_app(database_url)
+    with app.app_context():
+        if reset:
+            db.drop_all()
+        db.create_all()
+        counts = seed_database(users, personnel, years, tasks_per_day, logs, seed, echo=click.echo)
+    click.echo('完成：' + '，'.join(f'{name} {count}' for name, count in counts.items()))
+
+
+@cli.command()
+@database_option
+@click.option('--iterations', '-n', type=int, default=30, show_default=True, help='每个场景计时的请求次数。')
+@click.option('--warmup', type=int, default=3, show_default=True, help='每个场景先执行且不计时的次数。')
+@click.option('--scenario', '-s', 'scenarios', multiple=True,
+              type=click.Choice([name for name, _, _ in SCENARIOS]), help='只运行指定场景，可重复。')
+@click.option('--cache', is_flag=True, help='开启周视图缓存。')
+@click.option('--replica-url', 'replica_urls', multiple=True,
+              help='只读副本的数据库地址，可重复；只读页面的查询会发送到这些副本。')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='把结果写入 JSON 文件。')
+@click.option('--baseline', type=click.Path(dir_okay=False), default=None,
+              help=f'与基线比较，有退化时以非零状态退出。默认 {DEFAULT_BASELINE}（存在时）。')
+@click.option('--save-baseline', is_flag=True, help='把本次结果写为基线文件。')
+@click.option('--threshold', type=float, default=1.25, show_default=True, help='延迟超过基线多少倍视为退化。')
+def run(database_url, iterations, warmup, scenarios, cache, replica_urls, output, baseline, save_baseline,
+        threshold):
+    """运行基准测试。"""
+    app = make_app(database_url, cache, replica_urls)
+    results = run_benchmarks(app, iterations, warmup, scenarios, echo=click.echo)
+    click.echo(format_results(results))
+    if output:
+        save_json(output, results)
+
+    baseline_path = baseline or DEFAULT_BASELINE
+    if save_baseline:
+        save_json(baseline_path, results)
+        click.echo(f'已写入基线 {baseline_path}')
+        return
+    if baseline or os.path.exists(baseline_path):
+        lines, regressed = compare_results(results, load_json(baseline_path), threshold)
+        click.echo(f'\n与基线 {baseline_path} 比较：')
+        for line in lines:
+            click.echo('  ' + line)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
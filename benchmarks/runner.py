@@ -0,0 +1,184 @@
+import json
+import platform
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from sqlalchemy import event, func, select
+from app import db
+from app.models import WorkSchedule, TaskAssignment, ActivityLog
+from .scenarios import SCENARIOS, BenchmarkContext
+from .seed import BENCH_USERNAME, BENCH_PASSWORD
+
+PERCENTILES = (50, 90, 99)
+
+
+class QueryCounter:
+    """统计当前线程执行的 SQL 条数和耗时，不计入后台线程（如操作日志写入器）。"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.thread_id = threading.get_ident()
+        self.count = 0
+        self.seconds = 0.0
+        self._started = {}
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before)
+        event.listen(self.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+
+    def reset(self):
+        self.count, self.seconds = 0, 0.0
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = self._started.pop(id(cursor), None)
+        if started is not None:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def login(client):
+    response = client.post('/auth/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError('基准测试用户登录失败，请先运行 python -m benchmarks seed。')
+
+
+def _timed_request(request, client, args):
+    started = time.perf_counter()
+    response = request(client, args)
+    # 流式响应（导出文件）需要读完才算请求结束
+    response.get_data()
+    elapsed = time.perf_counter() - started
+    response.close()
+    return response.status_code, elapsed
+
+
+def run_scenario(app, client, counter, ctx, prepare, request, iterations, warmup):
+    """执行一个场景，返回延迟分位数（毫秒）、平均 SQL 条数和单次请求的峰值内存（KiB）。"""
+    durations, queries, sql_seconds, errors = [], [], [], 0
+    for i in range(warmup + iterations):
+        with app.app_context():
+            args = prepare(ctx)
+        counter.reset()
+        status, elapsed = _timed_request(request, client, args)
+        if i < warmup:
+            continue
+        if status >= 400:
+            errors += 1
+        durations.append(elapsed * 1000)
+        queries.append(counter.count)
+        sql_seconds.append(counter.seconds * 1000)
+
+    # tracemalloc 会显著拖慢执行，峰值内存单独再跑一次测量
+    with app.app_context():
+        args = prepare(ctx)
+    tracemalloc.start()
+    try:
+        _timed_request(request, client, args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    values = np.asarray(durations)
+    result = {f'p{p}_ms': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    result.update({
+        'iterations': iterations,
+        'mean_ms': round(float(values.mean()), 3),
+        'max_ms': round(float(values.max()), 3),
+        'queries_mean': round(float(np.mean(queries)), 2),
+        'queries_max': int(max(queries)),
+        'sql_ms_mean': round(float(np.mean(sql_seconds)), 3),
+        'peak_memory_kib': round(peak / 1024, 1),
+        'errors': errors,
+    })
+    return result
+
+
+def dataset_size():
+    return {
+        'tasks': db.session.scalar(select(func.count(WorkSchedule.id))),
+        'assignments': db.session.scalar(select(func.count(TaskAssignment.id))),
+        'activity_logs': db.session.scalar(select(func.count(ActivityLog.id))),
+    }
+
+
+def run_benchmarks(app, iterations=30, warmup=3, scenarios=None, seed=0, echo=print):
+    """依次运行选定的场景（默认全部），返回可写入 JSON 的结果。"""
+    client = app.test_client()
+    login(client)
+    with app.app_context():
+        ctx = BenchmarkContext(seed)
+        engine = db.engine
+        meta = {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': engine.dialect.name,
+            'dataset': dataset_size(),
+            'iterations': iterations,
+        }
+
+    results = {}
+    with QueryCounter(engine) as counter:
+        for name, prepare, request in SCENARIOS:
+            if scenarios and name not in scenarios:
+                continue
+            echo(f'运行 {name} ...')
+            results[name] = run_scenario(app, client, counter, ctx, prepare, request, iterations, warmup)
+    return {'meta': meta, 'scenarios': results}
+
+
+def format_results(results):
+    header = f"{'场景':<22}{'p50':>10}{'p90':>10}{'p99':>10}{'SQL条数':>10}{'峰值KiB':>12}{'错误':>6}"
+    lines = [header]
+    for name, r in results['scenarios'].items():
+        lines.append(f"{name:<22}{r['p50_ms']:>10.1f}{r['p90_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+                     f"{r['queries_mean']:>10.1f}{r['peak_memory_kib']:>12.1f}{r['errors']:>6}")
+    return '\n'.join(lines)
+
+
+def compare_results(results, baseline, threshold=1.25):
+    """
+    与基线逐场景比较 p50 / p90 和平均 SQL 条数。延迟超过基线 threshold 倍，
+    或每次请求多出至少一条 SQL 时视为退化。返回 (报告文本行, 是否有退化)。
+    """
+    lines, regressed = [], False
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            lines.append(f'{name}: 基线中没有该场景')
+            continue
+        problems = []
+        for key in ('p50_ms', 'p90_ms'):
+            ratio = current[key] / base[key] if base[key] else 1.0
+            if ratio > threshold:
+                problems.append(f'{key} {base[key]:.1f} -> {current[key]:.1f} ({ratio:.2f}x)')
+        if current['queries_mean'] >= base['queries_mean'] + 1:
+            problems.append(f"SQL 条数 {base['queries_mean']} -> {current['queries_mean']}")
+        if problems:
+            regressed = True
+            lines.append(f'{name}: 退化 ' + '；'.join(problems))
+        else:
+            lines.append(f"{name}: 正常 (p50 {base['p50_ms']:.1f} -> {current['p50_ms']:.1f} ms)")
+    return lines, regressed
+
+
+def load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
@@ -0,0 +1,109 @@
+import json
+import random
+from datetime import timedelta
+from sqlalchemy import func, select
+from app import db
+from app.models import WorkSchedule
+from app.schedule import day_task_versions
+from .seed import content_pool
+
+JSON_HEADERS = {'Accept': 'application/json'}
+
+
+class BenchmarkContext:
+    """场景共用的随机数和样本数据（已有任务、有多个任务的日期、数据的日期范围）。"""
+
+    SAMPLE_SIZE = 500
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        first_day, last_day = db.session.execute(
+            select(func.min(WorkSchedule.task_date), func.max(WorkSchedule.task_date))
+            .where(WorkSchedule.is_deleted == False)
+        ).one()
+        if first_day is None:
+            raise RuntimeError('数据库中没有任务，请先运行 python -m benchmarks seed。')
+        self.first_day, self.last_day = first_day, last_day
+        self.task_ids = db.session.scalars(
+            select(WorkSchedule.id).where(WorkSchedule.is_deleted == False)
+            .order_by(func.random()).limit(self.SAMPLE_SIZE)
+        ).all()
+        self.busy_days = db.session.scalars(
+            select(WorkSchedule.task_date).where(WorkSchedule.is_deleted == False)
+            .group_by(WorkSchedule.task_date).having(func.count() >= 2)
+            .order_by(func.random()).limit(self.SAMPLE_SIZE)
+        ).all()
+        self.contents = content_pool()
+
+    def random_day(self):
+        return self.first_day + timedelta(days=self.rng.randrange((self.last_day - self.first_day).days + 1))
+
+
+def prepare_index(ctx):
+    return {'start_date': ctx.random_day().isoformat()}
+
+
+def request_index(client, args):
+    return client.get('/', query_string=args)
+
+
+def prepare_add_task(ctx):
+    start = ctx.random_day()
+    return {
+        'content': ctx.rng.choice(ctx.contents),
+        'personnel': json.dumps([{'value': '基准测试'}], ensure_ascii=False),
+        'start_date': start.isoformat(),
+        'end_date': (start + timedelta(days=4)).isoformat(),
+    }
+
+
+def request_add_task(client, args):
+    return client.post('/add_task', data=args, headers=JSON_HEADERS)
+
+
+def prepare_task_range(ctx):
+    return ctx.rng.choice(ctx.task_ids)
+
+
+def request_task_range(client, task_id):
+    return client.get(f'/api/get_task_with_range/{task_id}', headers=JSON_HEADERS)
+
+
+def prepare_reorder(ctx):
+    """把某天的第一个任务拖到当天末尾，版本号取当前值，避免冲突。"""
+    day = ctx.rng.choice(ctx.busy_days)
+    tasks = [{'id': task_id, 'version': version} for task_id, version, _ in day_task_versions(day)]
+    tasks.append(tasks.pop(0))
+    day_list = {'date': day.isoformat(), 'tasks': tasks}
+    return {'moved_task': tasks[-1], 'source_list': day_list, 'target_list': day_list}
+
+
+def request_reorder(client, payload):
+    return client.post('/api/reorder_tasks', json=payload, headers=JSON_HEADERS)
+
+
+def prepare_export(ctx):
+    return {'start_date': ctx.random_day().isoformat()}
+
+
+def request_export(client, args):
+    return client.post('/export_excel', data=args)
+
+
+def prepare_logs(ctx):
+    return {}
+
+
+def request_logs(client, args):
+    return client.get('/logs', query_string=args)
+
+
+# (名称, 准备参数（不计时，在应用上下文中执行）, 发出请求（计时）)
+SCENARIOS = [
+    ('index', prepare_index, request_index),
+    ('add_task_range', prepare_add_task, request_add_task),
+    ('get_task_with_range', prepare_task_range, request_task_range),
+    ('reorder_tasks', prepare_reorder, request_reorder),
+    ('export_excel', prepare_export, request_export),
+    ('activity_logs', prepare_logs, request_logs),
+]
@@ -0,0 +1,156 @@
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert
+from app import db, bcrypt
+from app.content import intern_contents
+from app.models import User, Personnel, WorkSchedule, TaskAssignment, ActivityLog
+from app.schedule import POSITION_GAP
+from app.search import build_search_text
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench'
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高'
+GIVEN_NAMES = '伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚'
+PROJECTS = ['一号楼', '二号楼', '东区管网', '西区变电站', '南门改造', '北区绿化', '地下车库', '三期厂房',
+            '办公楼装修', '食堂改造', '仓库扩建', '道路硬化', '污水处理站', '消防通道', '屋面防水']
+TASK_TEMPLATES = [
+    '<p>{project}现场巡检</p>',
+    '<p><strong>{project}</strong>进度协调会</p>',
+    '<p>{project}材料验收</p>',
+    '<p>{project}安全检查，重点关注<span style="color: #e03e2d">高处作业</span></p>',
+    '<p>{project}图纸会审</p>',
+    '<p>{project}隐蔽工程验收<br>需提前通知监理</p>',
+    '<p>{project}设备调试</p>',
+    '<p>{project}质量整改复查</p>',
+]
+LOG_ACTIONS = ['用户登录', '创建任务', '更新任务', '拖拽任务', '软删除任务', '恢复任务', '导出Excel', '用户登出']
+
+BATCH_SIZE = 5000
+
+
+def content_pool():
+    return [template.format(project=project) for template in TASK_TEMPLATES for project in PROJECTS]
+
+
+def personnel_names(count, rng):
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_NAMES) for _ in range(rng.choice((1, 2))))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def seed_users(count, rng):
+    """基准测试用的管理员 bench 加上 count 个权限随机的普通用户，共用一个密码哈希以节省时间。"""
+    password_hash = bcrypt.generate_password_hash(BENCH_PASSWORD).decode('utf-8')
+    rows = [{'username': BENCH_USERNAME, 'password_hash': password_hash, 'is_admin': True,
+             'can_add': True, 'can_edit': True, 'can_delete': True}]
+    rows += [{'username': f'user{i:04d}', 'password_hash': password_hash, 'is_admin': False,
+              'can_add': rng.random() < 0.6, 'can_edit': rng.random() < 0.5, 'can_delete': rng.random() < 0.3}
+             for i in range(count)]
+    return list(db.session.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), rows))
+
+
+def _flush_tasks(task_rows, task_personnel, personnel_ids):
+    task_ids = list(db.session.scalars(
+        insert(WorkSchedule).returning(WorkSchedule.id, sort_by_parameter_order=True), task_rows
+    ))
+    assignment_rows = [
+        {'task_id': task_id, 'personnel_id': personnel_ids[name], 'personnel_name': name, 'position': index}
+        for task_id, names in zip(task_ids, task_personnel)
+        for index, name in enumerate(names)
+    ]
+    if assignment_rows:
+        db.session.execute(insert(TaskAssignment), assignment_rows)
+    db.session.commit()
+    return len(task_ids)
+
+
+def seed_tasks(years, tasks_per_day, user_ids, personnel_ids, rng, echo=print):
+    """
+    从 years 年前到 60 天后，每个工作日平均 tasks_per_day 个任务（周末减半），
+    约五分之一的任务连续持续 2-5 天并共享 series_id，每个任务分配 1-3 名人员。
+    """
+    pool = content_pool()
+    content_ids = intern_contents(pool)
+    names = list(personnel_ids)
+    start = date.today() - timedelta(days=365 * years)
+    end = date.today() + timedelta(days=60)
+
+    next_positions = {}
+    task_rows, task_personnel, created = [], [], 0
+    now = datetime.utcnow()
+    day = start
+    while day <= end:
+        mean = tasks_per_day if day.weekday() < 5 else tasks_per_day / 2
+        for _ in range(max(0, round(rng.gauss(mean, mean / 3)))):
+            content = rng.choice(pool)
+            assigned = rng.sample(names, rng.choice((1, 1, 2, 3)))
+            span = rng.randint(2, 5) if rng.random() < 0.2 else 1
+            series_id = uuid.uuid4().hex if span > 1 else None
+            author_id = rng.choice(user_ids)
+            for offset in range(span):
+                task_day = day + timedelta(days=offset)
+                position = next_positions.get(task_day, 0)
+                next_positions[task_day] = position + POSITION_GAP
+                task_rows.append({
+                    'task_date': task_day,
+                    'content_id': content_ids[content],
+                    'search_text': build_search_text(content, assigned),
+                    'author_id': author_id,
+                    'position': position,
+                    'series_id': series_id,
+                    'created_at': now,
+                    'updated_at': now,
+                })
+                task_personnel.append(assigned)
+        if len(task_rows) >= BATCH_SIZE:
+            created += _flush_tasks(task_rows, task_personnel, personnel_ids)
+            task_rows, task_personnel = [], []
+            echo(f'  已写入 {created} 个任务（{day.isoformat()}）')
+        next_positions.pop(day - timedelta(days=1), None)
+        day += timedelta(days=1)
+    if task_rows:
+        created += _flush_tasks(task_rows, task_personnel, personnel_ids)
+    return created
+
+
+def seed_logs(count, years, user_ids, rng, echo=print):
+    """写入 count 条时间分布在 years 年内的操作日志，按批提交。"""
+    span_seconds = 365 * years * 86400
+    base = datetime.utcnow() - timedelta(seconds=span_seconds)
+    written = 0
+    batch_size = BATCH_SIZE * 4
+    while written < count:
+        size = min(batch_size, count - written)
+        db.session.execute(insert(ActivityLog), [{
+            'user_id': rng.choice(user_ids),
+            'action': rng.choice(LOG_ACTIONS),
+            'details': f'基准测试数据 #{written + i}',
+            'timestamp': base + timedelta(seconds=rng.randrange(span_seconds)),
+        } for i in range(size)])
+        db.session.commit()
+        written += size
+        if written % (batch_size * 10) == 0 or written == count:
+            echo(f'  已写入 {written} 条操作日志')
+    return written
+
+
+def seed_database(users=20, personnel=60, years=2, tasks_per_day=8, logs=200000, seed=42, echo=print):
+    """在当前应用上下文的数据库中生成基准测试数据，返回各表写入的行数。"""
+    rng = random.Random(seed)
+    user_ids = seed_users(users, rng)
+    names = personnel_names(personnel, rng)
+    db.session.execute(insert(Personnel), [{'name': name} for name in names])
+    personnel_ids = dict(db.session.query(Personnel.name, Personnel.id).all())
+    db.session.commit()
+    echo(f'已写入 {len(user_ids)} 个用户、{len(names)} 名人员')
+
+    tasks = seed_tasks(years, tasks_per_day, user_ids, personnel_ids, rng, echo)
+    log_count = seed_logs(logs, years, user_ids, rng, echo)
+    return {'users': len(user_ids), 'personnel': len(names), 'tasks': tasks, 'activity_logs': log_count}